@@ -1,10 +1,18 @@
-import sqlite3
 import time
-from classes import User, UserType, Member
+from classes import User, UserType, Member, Session, preload
 from validation import *
-from encryption import initialize_keys, encrypt_data_str, decrypt_data, hash_password, compare_passwords
+from encryption import (initialize_keys, encrypt_data, decrypt_data, hash_password, compare_passwords,
+                        is_legacy_ciphertext, blind_index, shutdown_pool, needs_reencryption,
+                        rotate_data_key, get_active_key_id, encrypt_many, map_on_pool)
 from logging import Logger, LogEntry
+import log_export
+import member_import
+import member_export
+from pipeline import run_pipeline
+from cache import LRUCache
+from db_pool import ConnectionPool
 import os
+import json
 import zipfile
 from datetime import datetime
 
@@ -14,15 +22,29 @@ if __name__ == "__main__":
 DB_PATH = "unique_meal.db"
 LOGS_PATH = "logs.bin"
 BACKUP_PATH = "backups"
-
-_db_connection: sqlite3.Connection = None
-_db_cursor: sqlite3.Cursor = None
-_current_user: User = None
+EXPORT_PATH = "exports"
+ROTATION_CHECKPOINT_PATH = "key_rotation.json"
+
+# When enabled, a member is stored as one encrypted record (in the `record` column) instead of 11 encrypted columns.
+# Members that are still stored in the columns (from before this existed) can always be read.
+ROW_LEVEL_MEMBERS = True
+USER_FIELDS = ("username", "password", "type", "first_name", "last_name", "registration_date")
+MEMBER_FIELDS = ("first_name", "last_name", "age", "gender", "weight", "street",
+                 "house_number", "zip", "city", "email", "phone")
+ENCRYPTED_COLUMNS = {"users": USER_FIELDS, "members": (*MEMBER_FIELDS, "record")}
+
+# the decrypted members and users are cached (by id), so they don't have to be decrypted again on every page
+MEMBER_CACHE_SIZE = 10_000
+USER_CACHE_SIZE = 1_000
+
+_pool: ConnectionPool = None  # every thread gets its own connection from this pool, see db_pool.py
 _logger: Logger = None
-
-
-def get_current_user() -> User:
-    return _current_user
+_member_cache = LRUCache(MEMBER_CACHE_SIZE)
+_user_cache = LRUCache(USER_CACHE_SIZE)
+# the failed logins are counted per username, so a successful login of someone else doesn't reset the count.
+# Only the most recent usernames are kept, so trying a lot of different usernames can't fill up the memory
+FAILED_LOGINS_SIZE = 10_000
+_failed_logins = LRUCache(FAILED_LOGINS_SIZE)
 
 
 def setup_database() -> None:
@@ -30,59 +52,153 @@ def setup_database() -> None:
     This function sets up the database connection and creates the users table if it doesn't exist.
     Calling this method before the rest of the code will ensure that the database is ready to be used.
     """
-    global _db_connection, _db_cursor, _logger
+    global _pool, _logger
     initialize_keys()
+    clear_caches()
+    if _logger:
+        _logger.close()  # so the logs it still has queued are written before the new one reads the header
     _logger = Logger(LOGS_PATH)
-    _db_connection = sqlite3.connect(DB_PATH)
-    _db_cursor = _db_connection.cursor()
-    _db_cursor.execute('''CREATE TABLE IF NOT EXISTS users
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT, password TEXT, type TEXT,
-                first_name TEXT, last_name TEXT, registration_date TEXT)''')
-
-    _db_cursor.execute('''CREATE TABLE IF NOT EXISTS members
-                    (id INTEGER PRIMARY KEY, first_name TEXT, last_name TEXT, age TEXT,
-                    gender TEXT, weight REAL, street TEXT, house_number TEXT, zip TEXT,
-                    city TEXT, email TEXT, phone TEXT)''')
+    if _pool:
+        _pool.close()
+    _pool = ConnectionPool(DB_PATH)
+    _pool.execute('''CREATE TABLE IF NOT EXISTS users
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT, username BLOB, password BLOB, type BLOB,
+                first_name BLOB, last_name BLOB, registration_date BLOB)''')
+
+    _pool.execute('''CREATE TABLE IF NOT EXISTS members
+                    (id INTEGER PRIMARY KEY, first_name BLOB, last_name BLOB, age BLOB,
+                    gender BLOB, weight BLOB, street BLOB, house_number BLOB, zip BLOB,
+                    city BLOB, email BLOB, phone BLOB, record BLOB)''')
+
+    # the progress of a member import, saved in the same transaction as the members of every chunk
+    _pool.execute('''CREATE TABLE IF NOT EXISTS member_imports
+                    (file_path TEXT PRIMARY KEY, file_size INTEGER, rows INTEGER, created INTEGER,
+                    rejected INTEGER, reject_size INTEGER)''')
+
+    # databases from before these columns existed don't have them yet
+    _add_column_if_missing("members", "record", "BLOB")
+    _add_column_if_missing("users", "username_idx", "TEXT")
+    _add_column_if_missing("members", "email_idx", "TEXT")
+    _pool.execute("CREATE INDEX IF NOT EXISTS users_username_idx ON users (username_idx)")
+    _pool.execute("CREATE INDEX IF NOT EXISTS members_email_idx ON members (email_idx)")
+    _pool.commit()
+    backfill_blind_indexes()
 
     # Check if the users table is empty
-    _db_cursor.execute("SELECT COUNT(*) FROM users")
-
-    if _db_cursor.fetchone()[0] == 0:
+    if _pool.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 0:
         # creating the super admin user if there is no user in the database (aka if its newly created)
-        _db_cursor.execute(
+        _pool.execute(
             """
-            INSERT INTO users (username, password, type, first_name, last_name, registration_date)
-            VALUES (?, ?, ?, ?, ?, ?)
+            INSERT INTO users (username, password, type, first_name, last_name, registration_date, username_idx)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
             """,
             (
-                encrypt_data_str("super_admin"),
-                encrypt_data_str(hash_password("Admin_123?")),
-                encrypt_data_str(f"{UserType.SUPER_ADMIN.value}"),
-                encrypt_data_str("Super"),
-                encrypt_data_str("Admin"),
-                encrypt_data_str(time.strftime("%Y-%m-%d"))
+                encrypt_data("super_admin"),
+                encrypt_data(hash_password("Admin_123?")),
+                encrypt_data(f"{UserType.SUPER_ADMIN.value}"),
+                encrypt_data("Super"),
+                encrypt_data("Admin"),
+                encrypt_data(time.strftime("%Y-%m-%d")),
+                blind_index("super_admin")
             )
         )
-        _db_connection.commit()
+        _pool.commit()
         _logger.log("System", "Database setup", "The database has been setup", False)
 
 
+def _add_column_if_missing(table: str, column: str, column_type: str) -> None:
+    if column not in [info[1] for info in _pool.execute(f"PRAGMA table_info({table})").fetchall()]:
+        _pool.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+
+
+def backfill_blind_indexes() -> int:
+    """
+    Fills in the blind index columns for all the rows that don't have them yet (rows from before they existed).
+    This only has to decrypt those rows, so once everything is filled in, this costs nothing.
+    :return: the amount of rows that have been filled in
+    """
+    users = _users_from_rows(
+        _pool.execute(f"SELECT id, {', '.join(USER_FIELDS)} FROM users WHERE username_idx IS NULL").fetchall())
+    preload(users, "username")
+    for user in users:
+        _pool.execute("UPDATE users SET username_idx = ? WHERE id = ?", (blind_index(user.username), user.id))
+
+    members = _members_from_rows(
+        _pool.execute(f"SELECT id, {', '.join(MEMBER_FIELDS)}, record FROM members WHERE email_idx IS NULL").fetchall())
+    preload(members, "email")
+    for member in members:
+        _pool.execute("UPDATE members SET email_idx = ? WHERE id = ?",
+                      (_email_index(member.email), member.id))
+
+    _pool.commit()
+    if users or members:
+        _logger.log("System", "Filled in blind indexes", f"users: {len(users)}, members: {len(members)}", False)
+    return len(users) + len(members)
+
+
+def _email_index(email: str) -> str:
+    # emails are not case-sensitive, so the index should not be either
+    return blind_index(email.lower())
+
+
+def _email_in_use(email: str, except_member_id: int = None) -> bool:
+    rows = _pool.execute("SELECT id FROM members WHERE email_idx = ?", (_email_index(email),)).fetchall()
+    return any(row[0] != except_member_id for row in rows)
+
+
+def _existing_values(column: str, values: list) -> set:
+    """
+    :return: the values that are already used in this column of the members table
+    """
+    existing = set()
+    # sqlite has a limit on the amount of parameters in a query, so we do this in chunks
+    for start in range(0, len(values), 500):
+        chunk = values[start:start + 500]
+        rows = _pool.execute(f"SELECT {column} FROM members WHERE {column} IN ({', '.join('?' * len(chunk))})",
+                             chunk).fetchall()
+        existing.update(row[0] for row in rows)
+    return existing
+
+
+def _new_member_ids(count: int) -> list[int]:
+    """
+    :return: new member ids that are not used yet, and all different from each other
+    """
+    # with thousands of random ids at once, a few of them will be the same (or already in use), those are made again
+    member_ids: set[int] = set()
+    while len(member_ids) < count:
+        new_ids = {int(generate_user_id()) for _ in range(count - len(member_ids))} - member_ids
+        member_ids |= new_ids - _existing_values("id", list(new_ids))
+    return list(member_ids)
+
+
 def close_database() -> None:
-    if _db_connection:
-        _db_connection.close()
+    if _pool:
+        _pool.close()
+    if _logger:
+        _logger.close()  # writes the last batch of queued logs
+    shutdown_pool()
 
 
-def logout_user() -> None:
-    global _current_user
-    if _current_user:
-        _logger.log(_current_user.username, "Logged out", "", False)
-        _current_user = None
+def logout_user(session: Session) -> None:
+    if session and session.active:
+        _logger.log(session.user.username, "Logged out", "", False)
+        session.active = False
 
 
-def is_authorized(user_type: UserType) -> bool:
-    if _current_user:
-        return _current_user.type.value >= user_type.value
-    return False
+def is_authorized(session: Session, user_type: UserType) -> bool:
+    """
+    The user of the session is loaded again (from the cache, which is cleared when another process changes the db),
+    so a user that has been deleted or changed since the login doesn't keep the rights it had back then
+    """
+    if session is None or not session.active:
+        return False
+    users = _load_users([session.user.id])
+    if not users:
+        session.active = False  # the user has been deleted
+        return False
+    session.user = users[0]
+    return session.is_authorized(user_type)
 
 
 # note that this error will probably never happen in our application since you will not be able to view options that
@@ -90,17 +206,18 @@ def is_authorized(user_type: UserType) -> bool:
 # However, as specially on the web, you cant just assume that people are only using your interface
 def authorize(user_type: UserType):
     """
-    This is a decorator that will check if the current user is authorized to perform the action.
+    This is a decorator that will check if the user of the session of the Database object
+    is authorized to perform the action.
     If the user is not authorized, then an error will be added to the errors list.
     \n Usage: @authorize(UserType.ADMIN)
     """
 
     def decorator(func):
         def wrapper(self, *args, **kwargs):
-            if is_authorized(user_type):
+            if is_authorized(self.session, user_type):
                 return func(self, *args, **kwargs)
             self.errors.append("You are not authorized to perform this action.")
-            username = _current_user.username if _current_user else "..."
+            username = self.session.user.username if self.session else "..."
             _logger.log(username, "Unauthorized action", "", True)
             return None
 
@@ -119,17 +236,430 @@ def _get_all_users() -> list[User]:
     Instead use `Database().get_all_users()` which returns the same thing,
     but has some validation if the user can actually retrieve it
     """
-    _db_cursor.execute("SELECT * FROM users")
-    users = _db_cursor.fetchall()
+    return _load_users([row[0] for row in _pool.execute("SELECT id FROM users ORDER BY id").fetchall()])
 
-    return_list = []
-    # we cant search for the encrypted data in the db, since the encryption is kinda
-    # random since the encryption adds random padding to the input data
-    for user in users:
-        decrypted_user = tuple(decrypt_data(user_data) for user_data in user[1:])
-        return_list.append(User(user[0], *decrypted_user))
 
-    return return_list
+def _users_from_rows(rows: list[tuple]) -> list[User]:
+    """
+    The fields are only decrypted once they are read (use `classes.preload` to decrypt them for a list in one batch)
+    :param rows: rows of the users table selected with `SELECT id, <USER_FIELDS>`
+    """
+    return [User.from_encrypted(row[0], *row[1:]) for row in rows]
+
+
+def _get_users_by_username(username: str) -> list[User]:
+    """
+    Finds the users with this username using the blind index, so only the matching rows are decrypted
+    """
+    rows = _pool.execute("SELECT id FROM users WHERE username_idx = ?", (blind_index(username),)).fetchall()
+    return [user for user in _load_users([row[0] for row in rows]) if user.username == username]
+
+
+def _check_cache_version() -> None:
+    # When another connection (like seeds.py, or another terminal) commits to the db,
+    # we can't know what they changed, so then we just start over with empty caches
+    if _pool.data_changed():
+        clear_caches()
+
+
+def clear_caches() -> None:
+    _member_cache.clear()
+    _user_cache.clear()
+
+
+def get_cache_stats() -> dict[str, dict]:
+    """
+    :return: the size and the hit/miss counters of the member and user caches
+    """
+    return {"members": _member_cache.stats(), "users": _user_cache.stats()}
+
+
+def get_pool_stats() -> dict:
+    """
+    :return: the amount of connections, statements and commits, and how often (and long) it had to wait for a lock
+    """
+    return _pool.stats()
+
+
+def _load_cached(cache: LRUCache, ids: list[int], select: str, from_rows) -> list:
+    """
+    :param ids: the ids to load, the result is in the same order (ids that don't exist are left out)
+    :param select: the select query without the WHERE
+    :param from_rows: the function that decrypts the selected rows into objects
+    :return: the objects with these ids, only the ones that are not cached yet are selected and decrypted
+    """
+    _check_cache_version()
+    found = {}
+    missing = []
+    for entity_id in ids:
+        entity = cache.get(entity_id)
+        if entity is None:
+            missing.append(entity_id)
+        else:
+            found[entity_id] = entity
+
+    # sqlite has a limit on the amount of parameters in a query, so we do this in chunks
+    for start in range(0, len(missing), 500):
+        chunk = missing[start:start + 500]
+        rows = _pool.execute(f"{select} WHERE id IN ({', '.join('?' * len(chunk))})", chunk).fetchall()
+        for entity in from_rows(rows):
+            cache.put(entity.id, entity)
+            found[entity.id] = entity
+
+    return [found[entity_id] for entity_id in ids if entity_id in found]
+
+
+def _load_users(ids: list[int]) -> list[User]:
+    return _load_cached(_user_cache, ids, f"SELECT id, {', '.join(USER_FIELDS)} FROM users", _users_from_rows)
+
+
+def _load_members(ids: list[int]) -> list[Member]:
+    return _load_cached(_member_cache, ids, f"SELECT id, {', '.join(MEMBER_FIELDS)}, record FROM members",
+                        _members_from_rows)
+
+
+def _reencrypt_rows(table: str, columns: tuple, rows: list[tuple], should_reencrypt) -> int:
+    """
+    Re-encrypts the values of these rows for which `should_reencrypt(value)` is True (without committing)
+    :param rows: rows of the table selected with `SELECT id, <columns>`
+    :return: the amount of re-encrypted values
+    """
+    reencrypted = 0
+    for row in rows:
+        new_values = {column: encrypt_data(decrypt_data(value)) for column, value in zip(columns, row[1:])
+                      if value is not None and should_reencrypt(value)}
+        if not new_values:
+            continue
+        assignments = ", ".join(f"{column} = ?" for column in new_values)
+        _pool.execute(f"UPDATE {table} SET {assignments} WHERE id = ?", (*new_values.values(), row[0]))
+        reencrypted += len(new_values)
+    return reencrypted
+
+
+def migrate_to_envelope_encryption() -> tuple[int, int]:
+    """
+    Re-encrypts every field in the database and every record in the log file that is still encrypted with the old
+    per-field RSA encryption. Values that are already envelope encrypted are skipped, so it is safe to run this twice.
+    :return: the amount of re-encrypted database fields and the amount of re-encrypted log records
+    """
+    migrated_fields = 0
+    for table, columns in ENCRYPTED_COLUMNS.items():
+        rows = _pool.execute(f"SELECT id, {', '.join(columns)} FROM {table}").fetchall()
+        migrated_fields += _reencrypt_rows(table, columns, rows, is_legacy_ciphertext)
+    # everything is committed at once, so the database is either completely migrated or not at all
+    _pool.commit()
+
+    migrated_logs = _logger.migrate_to_envelope_encryption()
+    _logger.log("System", "Migrated encryption",
+                f"fields: {migrated_fields}, log records: {migrated_logs}", False)
+    return migrated_fields, migrated_logs
+
+
+# The encrypted values used to be stored as hex strings, which takes twice the space of the raw bytes.
+# Now they are stored as BLOBs, the old hex values can still be read (decrypt_data accepts both) until this has run.
+def migrate_to_blob_storage() -> int:
+    """
+    Converts all the hex encoded encrypted values in the database into BLOBs.
+    This does not have to decrypt anything, since it's the same ciphertext, just stored more compactly.
+    :return: the amount of converted values
+    """
+    converted = 0
+    for table, columns in ENCRYPTED_COLUMNS.items():
+        for column in columns:
+            rows = _pool.execute(f"SELECT id, {column} FROM {table} WHERE typeof({column}) = 'text'").fetchall()
+            _pool.executemany(f"UPDATE {table} SET {column} = ? WHERE id = ?",
+                              [(bytes.fromhex(value), row_id) for row_id, value in rows])
+            converted += len(rows)
+    _pool.commit()
+    # the freed up space is only given back to the file system after a vacuum
+    _pool.execute("VACUUM")
+    _logger.log("System", "Migrated to BLOB storage", f"values: {converted}", False)
+    return converted
+
+
+# Key rotation: a new data key is made active right away (so all new data uses it), and then everything that is
+# encrypted with an older key is re-encrypted in small batches. Every batch is committed on its own, so the app can
+# keep on running in the meantime. The progress is saved in a checkpoint file after every batch,
+# so if it crashes, it continues where it left off instead of starting over.
+# The indexes of the log files are encrypted as well, they are done last (see `Logger.reencrypt_indexes`)
+# Other processes only see the new key when they notice that the keyring file changed, until then they can still
+# encrypt with the old key. So the stages are run again until a whole pass finds nothing left to re-encrypt.
+ROTATION_STAGES = ("users", "members", "logs", "log_indexes")
+
+
+def _save_rotation_checkpoint(checkpoint: dict) -> None:
+    with open(ROTATION_CHECKPOINT_PATH + ".tmp", "w") as file:
+        json.dump(checkpoint, file)
+    os.replace(ROTATION_CHECKPOINT_PATH + ".tmp", ROTATION_CHECKPOINT_PATH)
+
+
+def _load_rotation_checkpoint() -> dict | None:
+    if not os.path.exists(ROTATION_CHECKPOINT_PATH):
+        return None
+    with open(ROTATION_CHECKPOINT_PATH, "r") as file:
+        return json.load(file)
+
+
+def start_key_rotation() -> dict:
+    """
+    Starts a key rotation by making a new data key active. If there is an unfinished rotation,
+    that one is resumed instead (without making yet another key).
+    :return: the checkpoint of the rotation
+    """
+    checkpoint = _load_rotation_checkpoint()
+    if checkpoint:
+        return checkpoint
+    checkpoint = {"key_id": rotate_data_key(), "stage": ROTATION_STAGES[0], "position": 0, "reencrypted": 0,
+                  "pass_reencrypted": 0}
+    _save_rotation_checkpoint(checkpoint)
+    _logger.log("System", "Started key rotation", f"new key id: {checkpoint['key_id']}", False)
+    return checkpoint
+
+
+def run_key_rotation_batch(batch_size: int = 100) -> dict | None:
+    """
+    Re-encrypts the next batch of the key rotation that was started with `start_key_rotation`
+    :return: the new checkpoint, or None if the rotation is finished
+    """
+    checkpoint = _load_rotation_checkpoint()
+    if not checkpoint:
+        return None
+    if checkpoint["key_id"] != get_active_key_id():
+        initialize_keys()  # the rotation was started by another process, so we don't know the new key yet
+
+    stage = checkpoint["stage"]
+    if stage == "logs":
+        new_position, reencrypted = _logger.reencrypt_records(checkpoint["position"], batch_size)
+        done = new_position == checkpoint["position"]
+    elif stage == "log_indexes":
+        new_position, reencrypted = _logger.reencrypt_indexes(checkpoint["position"], batch_size)
+        done = new_position == checkpoint["position"]
+    else:
+        columns = ENCRYPTED_COLUMNS[stage]
+        rows = _pool.execute(f"SELECT id, {', '.join(columns)} FROM {stage} WHERE id > ? ORDER BY id LIMIT ?",
+                             (checkpoint["position"], batch_size)).fetchall()
+        reencrypted = _reencrypt_rows(stage, columns, rows, needs_reencryption)
+        _pool.commit()
+        done = not rows
+        new_position = rows[-1][0] if rows else checkpoint["position"]
+
+    # an older checkpoint does not count the passes, then everything so far counts as this pass
+    checkpoint.setdefault("pass_reencrypted", checkpoint["reencrypted"])
+    checkpoint["reencrypted"] += reencrypted
+    checkpoint["pass_reencrypted"] += reencrypted
+    checkpoint["position"] = new_position
+    if done:
+        next_stage_index = ROTATION_STAGES.index(stage) + 1
+        if next_stage_index == len(ROTATION_STAGES) and checkpoint["pass_reencrypted"]:
+            next_stage_index = 0  # check everything again, see above
+            checkpoint["pass_reencrypted"] = 0
+        elif next_stage_index == len(ROTATION_STAGES):
+            os.remove(ROTATION_CHECKPOINT_PATH)
+            _logger.log("System", "Finished key rotation",
+                        f"key id: {checkpoint['key_id']}, re-encrypted: {checkpoint['reencrypted']}", False)
+            return None
+        checkpoint["stage"] = ROTATION_STAGES[next_stage_index]
+        checkpoint["position"] = 0
+    _save_rotation_checkpoint(checkpoint)
+    return checkpoint
+
+
+def archive_logs(older_than_days: int = None) -> int:
+    """
+    Moves the sealed log segments older than this into an archive, see Logger.archive
+    :param older_than_days: the age (in days) of the logs to archive, by default ARCHIVE_AFTER_DAYS from logging.py
+    :return: the amount of archived logs
+    """
+    if _load_rotation_checkpoint():
+        # the rotation keeps track of its position in the log files, which would move if segments are archived
+        raise RuntimeError("A key rotation is still running, finish that first")
+    archived = _logger.archive(older_than_days)
+    if archived:
+        _logger.log("System", "Archived logs", f"logs: {archived}", False)
+    return archived
+
+
+def _encrypt_member_record(*values: str) -> bytes:
+    # the whole member is serialized as a compact json list (in the order of MEMBER_FIELDS) and encrypted once
+    return encrypt_data(json.dumps(values, separators=(",", ":")))
+
+
+def _members_from_rows(rows: list[tuple]) -> list[Member]:
+    """
+    The fields are only decrypted once they are read (use `classes.preload` to decrypt them for a list in one batch)
+    :param rows: rows of the members table selected with `SELECT id, <MEMBER_FIELDS>, record`
+    """
+    members = []
+    for member_id, *fields, record in rows:
+        if record is not None:
+            members.append(Member.from_encrypted_record(member_id, record))
+        else:
+            # compatibility path for members that are still stored in separately encrypted columns
+            members.append(Member.from_encrypted(member_id, *fields))
+    return members
+
+
+def _member_values(*values: str) -> tuple:
+    """
+    :return: the values for the MEMBER_FIELDS columns and the record column, depending on the storage layout
+    """
+    if ROW_LEVEL_MEMBERS:
+        return *(None for _ in MEMBER_FIELDS), _encrypt_member_record(*values)
+    return *(encrypt_data(value) for value in values), None
+
+
+def _member_values_many(members: list[tuple]) -> list[tuple]:
+    """
+    Same as `_member_values`, but for a batch of members that is encrypted at once on the worker pool
+    :param members: the values of every member, in the order of MEMBER_FIELDS
+    """
+    if ROW_LEVEL_MEMBERS:
+        records = encrypt_many([json.dumps(tuple(values), separators=(",", ":")) for values in members])
+        return [(*(None for _ in MEMBER_FIELDS), record) for record in records]
+    encrypted = iter(encrypt_many([value for values in members for value in values]))
+    return [(*(next(encrypted) for _ in MEMBER_FIELDS), None) for _ in members]
+
+
+def _member_data_errors(first_name: str, last_name: str, age: str, gender: str, weight: str, street: str,
+                        house_number: str, zip_code: str, city: str, email: str, phone: str) -> list[str]:
+    """
+    :return: a message for every field that is not valid, so an empty list if everything is valid
+    """
+    errors = []
+    if not is_valid_name(first_name):
+        errors.append("First name must be between 2 and 30 characters long "
+                      "and can only contain letters and spaces.")
+    if not is_valid_name(last_name):
+        errors.append("Last name must be between 2 and 30 "
+                      "characters long and can only contain letters and spaces.")
+    if not is_valid_age(age):
+        errors.append("Age must be between 0 and 120.")
+    if not is_valid_gender(gender):
+        errors.append("Gender must be 'M', 'F', or 'O'.")
+    if not is_valid_weight(weight):
+        errors.append("Weight must be a positive number.")
+    if not is_valid_phone_number(phone):
+        errors.append("Phone number must be a valid 10-digit number.")
+    if not is_valid_house_number(house_number):
+        errors.append("House number must be a positive integer.")
+    if not is_valid_street(street):
+        errors.append("Street must be between 2 and 50 characters long and can only contain letters,"
+                      " numbers, spaces, and hyphens.")
+    if not is_valid_zip_code(zip_code):
+        errors.append("Zip code must be a valid postal code format.")
+    if not is_valid_email(email):
+        errors.append("Email must be a valid email address.")
+    if not is_valid_city(city):
+        errors.append("City must be a valid city name from the predefined list.")
+    return errors
+
+
+def _iter_member_rows(fields: tuple[str], chunk_size: int):
+    """
+    Goes over the members table with a (server side) cursor, so only one chunk of rows is in memory at a time
+    :param fields: the fields to select (named like the arguments of `Database.create_member`)
+    :return: a generator with lists of rows: the id, the columns of these fields and the record
+    """
+    # the MEMBER_FIELDS columns are in the same order as the fields
+    columns = [MEMBER_FIELDS[member_import.IMPORT_FIELDS.index(field)] for field in fields]
+    # without any fields there is nothing to decrypt, so then the record is not selected either
+    cursor = _pool.execute(f"SELECT {', '.join(['id', *columns, 'record' if columns else 'NULL'])} "
+                           "FROM members ORDER BY id")
+    while rows := cursor.fetchmany(chunk_size):
+        yield rows
+
+
+def _member_row_errors(values: tuple) -> list[str]:
+    if len(values) != len(MEMBER_FIELDS):
+        return [f"A member must have {len(MEMBER_FIELDS)} values, not {len(values)}."]
+    return _member_data_errors(*values)
+
+
+def _prepare_members(rows: list[tuple], row_errors: dict[int, list[str]] = None) -> tuple[dict, dict]:
+    """
+    Validates the rows and encrypts the valid ones, both spread over the worker pool.
+    This doesn't use the db, so it can be done while the previous batch is being inserted.
+    :param rows: the values of every member, in the same order as the arguments of `Database.create_member`
+    :param row_errors: the rows that are already known to be invalid (by index), these are skipped
+    :return: the errors per row (by index) of all invalid rows,
+        and the values to insert (the MEMBER_FIELDS columns, the record and the email index) per row of the valid rows
+    """
+    row_errors = dict(row_errors or {})
+    indexes = [index for index in range(len(rows)) if index not in row_errors]
+    for index, errors in zip(indexes, map_on_pool(_member_row_errors, [rows[index] for index in indexes])):
+        if errors:
+            row_errors[index] = errors
+
+    # the email is the 10th value
+    valid = [index for index in indexes if index not in row_errors]
+    encrypted = _member_values_many([rows[index] for index in valid])
+    return row_errors, {index: (*values, _email_index(rows[index][9])) for index, values in zip(valid, encrypted)}
+
+
+IMPORT_PROGRESS_FIELDS = ("file_size", "rows", "created", "rejected", "reject_size")
+
+
+def _load_import_progress(file_path: str) -> dict | None:
+    """
+    :return: the progress of an unfinished import of this file, or None if there is none
+        (or if the file changed since, then it has to start over)
+    """
+    row = _pool.execute(f"SELECT {', '.join(IMPORT_PROGRESS_FIELDS)} FROM member_imports WHERE file_path = ?",
+                        (os.path.abspath(file_path),)).fetchone()
+    if not row or row[0] != os.path.getsize(file_path):
+        return None
+    return dict(zip(IMPORT_PROGRESS_FIELDS, row))
+
+
+def _save_import_progress(file_path: str, progress: dict) -> None:
+    # not committed here, it has to be in the same transaction as the members it is the progress of
+    _pool.execute(f"INSERT OR REPLACE INTO member_imports (file_path, {', '.join(IMPORT_PROGRESS_FIELDS)}) "
+                  f"VALUES (?{', ?' * len(IMPORT_PROGRESS_FIELDS)})",
+                  (os.path.abspath(file_path), *(progress[field] for field in IMPORT_PROGRESS_FIELDS)))
+
+
+def _insert_members(prepared: dict[int, tuple], row_errors: dict[int, list[str]]) -> dict[int, int]:
+    """
+    Inserts the members prepared by `_prepare_members` (without committing). The rows with an email that is already
+    used (in the db or by an earlier row) are not inserted, they get an error in row_errors instead.
+    :return: the new member id per row index
+    """
+    in_use = _existing_values("email_idx", list({values[-1] for values in prepared.values()}))
+    seen = set()
+    inserted = []
+    for index, values in prepared.items():
+        email_index = values[-1]
+        if email_index in in_use:
+            row_errors[index] = ["A member with this email already exists."]
+        elif email_index in seen:
+            row_errors[index] = ["An earlier row has the same email."]
+        else:
+            inserted.append(index)
+        seen.add(email_index)
+
+    member_ids = _new_member_ids(len(inserted))
+    _pool.executemany(
+        f"""
+        INSERT INTO members (id, {', '.join(MEMBER_FIELDS)}, record, email_idx)
+        VALUES ({', '.join('?' * (len(MEMBER_FIELDS) + 3))})
+        """, [(member_id, *prepared[index]) for member_id, index in zip(member_ids, inserted)])
+    return dict(zip(inserted, member_ids))
+
+
+def migrate_to_row_level_members() -> int:
+    """
+    Moves all the members that are still stored in separately encrypted columns into a single encrypted record.
+    :return: the amount of members that have been moved
+    """
+    rows = _pool.execute(f"SELECT id, {', '.join(MEMBER_FIELDS)}, record FROM members WHERE record IS NULL").fetchall()
+    for member_id, *fields, _record in rows:
+        _pool.execute(
+            f"UPDATE members SET {', '.join(f'{field} = NULL' for field in MEMBER_FIELDS)}, record = ? WHERE id = ?",
+            (_encrypt_member_record(*(decrypt_data(field) for field in fields)), member_id)
+        )
+    _pool.commit()
+    _logger.log("System", "Migrated members to row level records", f"members: {len(rows)}", False)
+    return len(rows)
 
 
 class Database:
@@ -137,18 +667,20 @@ class Database:
     This class is used to interact with the database. And it gathers all the errors along the way.
     These errors can be retrieved using the `get_errors` method.  Make sure to recreate this object for
     each database action to ensure that the errors are only from the current action.
+    The actions are done as the user of the session it is created with (the session that `login_user` returned).
     """
 
     # =================== #
     #    GENERIC LOGIC    #
     # =================== #
 
-    def logout_user(_self):
-        logout_user()  # alias for the global function (just to make it consistent, since login_user
+    def logout_user(self):
+        logout_user(self.session)  # alias for the global function (just to make it consistent, since login_user
         # requires a Database object, so now logout_user does can also be called with a Database object)
 
-    def __init__(self):
+    def __init__(self, session: Session = None):
         self.errors: list[str] = []
+        self.session: Session | None = session
 
     def get_errors(self) -> list[str]:
         """
@@ -156,14 +688,14 @@ class Database:
         """
         return self.errors
 
-    def login_user(self, username: str, password: str) -> User | None:
+    def login_user(self, username: str, password: str) -> Session | None:
         """
         :param username:
         :param password:
-        :return: Returns a User object if the username and password match, otherwise None
+        :return: Returns a new Session if the username and password match, otherwise None.
+            This Database object is bound to the new session as well
         """
-        global _current_user
-        if _current_user:
+        if self.session and self.session.active:
             self.errors.append("You are already logged in.")
             # This error will probably never happen since you will never be shown
             #   the login screen if you are already logged in
@@ -171,16 +703,16 @@ class Database:
 
         time.sleep(0.2)  # this query must have a little delay to prevent brute force attacks
 
-        all_users = _get_all_users()
-        for user in all_users:
-            if user.username == username and compare_passwords(password, user.password_hash):
-                _current_user = user
+        for user in _get_users_by_username(username):
+            if compare_passwords(password, user.password_hash):
+                self.session = Session(user)
                 _logger.log(user.username, "Logged in", "", False)
-                _logger.reset_fields()
-                return _current_user
+                _failed_logins.invalidate(username)
+                return self.session
 
         self.errors.append(f"Invalid username or password!")
-        if _logger.login_attempts > 2:
+        failed_logins = _failed_logins.get(username) or 0
+        if failed_logins > 2:
             _logger.log("...", "Unsuccessful login",
                         f"username: {username[0:20]}{'...' if len(username) > 20 else ''} "
                         "is used for a login attempt with a wrong password after more than 3 failed attempts",
@@ -190,7 +722,7 @@ class Database:
                         f"username: {username[0:20]}{'...' if len(username) > 20 else ''} "
                         "is used for a login attempt with a wrong password", False)
 
-        _logger.login_attempts += 1
+        _failed_logins.put(username, failed_logins + 1)
         return None
 
     # =================== #
@@ -202,69 +734,47 @@ class Database:
         """
         :return: Returns a list of all members in the database
         """
-        _db_cursor.execute("SELECT * FROM members")
-        members = _db_cursor.fetchall()
+        rows = _pool.execute("SELECT id FROM members ORDER BY id").fetchall()
+        # only the members that are not in the cache yet are decrypted
+        return _load_members([row[0] for row in rows])
 
-        return_list = []
-        # we cant search for the encrypted data in the db, since the encryption is kinda
-        # random since the encryption adds random padding to the input data
-        for mem in members:
-            decrypted_mem = tuple(decrypt_data(user_data) for user_data in mem[1:])
-            return_list.append(Member(mem[0], *decrypted_mem))
+    @authorize(UserType.CONSULTANT)
+    def count_members(self) -> int | None:
+        # this only counts the rows (using an index), nothing is decrypted
+        return _pool.execute("SELECT COUNT(*) FROM members").fetchone()[0]
 
-        return return_list
+    @authorize(UserType.CONSULTANT)
+    def get_members_page(self, after_id: int = None, limit: int = 9) -> list[Member] | None:
+        """
+        Keyset pagination: the page starts after the last member of the previous page (by id), instead of at an offset.
+        So the db jumps straight to it with the primary key, and only the members on the page are decrypted.
+        Every page costs the same, no matter how many members there are or how far in the list it is
+        :param after_id: the id of the last member of the previous page, None for the first page
+        :param limit: the amount of members on a page
+        :return: the members of the page, ordered by id
+        """
+        rows = _pool.execute("SELECT id FROM members WHERE id > ? ORDER BY id LIMIT ?",
+                             (-1 if after_id is None else after_id, limit)).fetchall()
+        return _load_members([row[0] for row in rows])
 
     @authorize(UserType.ADMIN)
     def delete_member(self, members_id: int) -> None:
-        _db_cursor.execute("DELETE FROM members WHERE id = ?", (members_id,))
-        _db_connection.commit()
-        _logger.log(_current_user.username, "Deleted member", f"Member ID: {members_id}", False)
+        _pool.execute("DELETE FROM members WHERE id = ?", (members_id,))
+        _pool.commit()
+        _member_cache.invalidate(members_id)
+        _logger.log(self.session.user.username, "Deleted member", f"Member ID: {members_id}", False)
 
     def _validate_member_data(self, first_name: str, last_name: str, age: str, gender: str, weight: str,
                               street: str, house_number: str, zip_code: str, city: str, email: str, phone: str) -> bool:
         """
         :return: Ture if everything is valid, otherwise it will return False
         """
-        first_name_valid = is_valid_name(first_name)
-        last_name_valid = is_valid_name(last_name)
-        age_valid = is_valid_age(age)
-        gender_valid = is_valid_gender(gender)
-        weight_valid = is_valid_weight(weight)
-        phone_valid = is_valid_phone_number(phone)
-        house_number_valid = is_valid_house_number(house_number)
-        street_valid = is_valid_street(street)
-        zip_code_valid = is_valid_zip_code(zip_code)
-        email_valid = is_valid_email(email)
-        city_valid = is_valid_city(city)
-        if all([first_name_valid, last_name_valid, age_valid, gender_valid, weight_valid, phone_valid,
-                house_number_valid, street_valid, zip_code_valid, email_valid, city_valid]):
+        errors = _member_data_errors(first_name, last_name, age, gender, weight, street,
+                                     house_number, zip_code, city, email, phone)
+        if not errors:
             return True
-        if not first_name_valid:
-            self.errors.append("First name must be between 2 and 30 characters long "
-                               "and can only contain letters and spaces.")
-        if not last_name_valid:
-            self.errors.append("Last name must be between 2 and 30 "
-                               "characters long and can only contain letters and spaces.")
-        if not age_valid:
-            self.errors.append("Age must be between 0 and 120.")
-        if not gender_valid:
-            self.errors.append("Gender must be 'M', 'F', or 'O'.")
-        if not weight_valid:
-            self.errors.append("Weight must be a positive number.")
-        if not phone_valid:
-            self.errors.append("Phone number must be a valid 10-digit number.")
-        if not house_number_valid:
-            self.errors.append("House number must be a positive integer.")
-        if not street_valid:
-            self.errors.append("Street must be between 2 and 50 characters long and can only contain letters,"
-                               " numbers, spaces, and hyphens.")
-        if not zip_code_valid:
-            self.errors.append("Zip code must be a valid postal code format.")
-        if not email_valid:
-            self.errors.append("Email must be a valid email address.")
-        if not city_valid:
-            self.errors.append("City must be a valid city name from the predefined list.")
-        _logger.log(_current_user.username, "Failed to create member", "Invalid input data", False)
+        self.errors.extend(errors)
+        _logger.log(self.session.user.username, "Failed to create member", "Invalid input data", False)
         return False
 
     @authorize(UserType.CONSULTANT)
@@ -274,29 +784,168 @@ class Database:
         if not self._validate_member_data(first_name, last_name, age, gender, weight, street,
                                           house_number, zip_code, city, email, phone):
             return
+        if _email_in_use(email):
+            self.errors.append("A member with this email already exists.")
+            _logger.log(self.session.user.username, "Failed to create member", "Email already exists", False)
+            return
 
-        _db_cursor.execute(
+        _pool.execute(
             """
-        INSERT INTO members (id, first_name, last_name, age, gender, weight, street, house_number, zip, city, email, phone)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        INSERT INTO members (id, first_name, last_name, age, gender, weight, street, house_number, zip, city, email, phone,
+                             record, email_idx)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         """, (
                 member_id,
-                encrypt_data_str(first_name),
-                encrypt_data_str(last_name),
-                encrypt_data_str(age),
-                encrypt_data_str(gender),
-                encrypt_data_str(weight),
-                encrypt_data_str(street),
-                encrypt_data_str(house_number),
-                encrypt_data_str(zip_code),
-                encrypt_data_str(city),
-                encrypt_data_str(email),
-                encrypt_data_str(phone)
+                *_member_values(first_name, last_name, age, gender, weight, street,
+                                house_number, zip_code, city, email, phone),
+                _email_index(email)
             )
         )
 
-        _db_connection.commit()
-        _logger.log(_current_user.username, "Created member", f"Member ID: {member_id}", False)
+        _pool.commit()
+        # the id is generated as a string, but the db stores it as an integer
+        _member_cache.put(int(member_id), Member(int(member_id), first_name, last_name, age, gender, weight, street,
+                                                 house_number, zip_code, city, email, phone))
+        _logger.log(self.session.user.username, "Created member", f"Member ID: {member_id}", False)
+
+    @authorize(UserType.CONSULTANT)
+    def create_members_bulk(self, rows: list[tuple]) -> tuple[list[int], dict[int, list[str]]] | None:
+        """
+        Creates a lot of members at once. All rows are validated first, then the valid ones are encrypted in one batch
+        and inserted in a single transaction, with one log entry for the whole batch (instead of one per member).
+        An invalid row does not stop the other rows from being created.
+        :param rows: the values of every member, in the same order as the arguments of `create_member`
+        :return: the ids of the created members (in the order of the rows),
+            and the errors per row (by its index in rows) of the rows that have not been created
+        """
+        row_errors, prepared = _prepare_members(rows)
+        try:
+            member_ids = _insert_members(prepared, row_errors)
+            _pool.commit()
+        except Exception as e:
+            # it's one transaction, so either all of them are created or none of them
+            _pool.rollback()
+            self.errors.append("Failed to create the members, none of them have been created.")
+            _logger.log(self.session.user.username, "Failed to create members", str(e), False)
+            return None
+
+        for index, member_id in member_ids.items():
+            _member_cache.put(member_id, Member(member_id, *rows[index]))
+        if row_errors:
+            self.errors.append(f"{len(row_errors)} of the {len(rows)} members could not be created.")
+        _logger.log(self.session.user.username, "Created members",
+                    f"created: {len(member_ids)}, invalid: {len(row_errors)}", False)
+        return list(member_ids.values()), dict(sorted(row_errors.items()))
+
+    @authorize(UserType.CONSULTANT)
+    def import_members(self, file_path: str) -> dict | None:
+        """
+        Imports the members from a csv or jsonl file, see member_import.py for the format.
+        The file is read, validated and encrypted in chunks (while the previous chunk is being inserted),
+        and every chunk is inserted in its own transaction. The rows that can't be imported are written to a reject
+        file next to it, with the reason. When the import is interrupted, importing the same file again continues after
+        the last chunk that was saved.
+        :return: the amount of created and rejected members, the path of the reject file (None if nothing is rejected),
+            and the rows per second
+        """
+        import_format = member_import.get_import_format(file_path)
+        if not os.path.isfile(file_path):
+            self.errors.append("File not found.")
+        elif not import_format:
+            self.errors.append(f"The file must be one of: {', '.join(member_import.IMPORT_FORMATS)}")
+        if self.errors:
+            _logger.log(self.session.user.username, "Failed to import members", "Invalid file", False)
+            return None
+
+        reject_path = member_import.get_reject_path(file_path)
+        checkpoint = _load_import_progress(file_path)
+        if checkpoint:
+            _logger.log(self.session.user.username, "Resumed member import",
+                        f"file: {os.path.basename(file_path)}, from row: {checkpoint['rows'] + 1}", False)
+        else:
+            checkpoint = {"file_size": os.path.getsize(file_path), "rows": 0, "created": 0, "rejected": 0,
+                          "reject_size": 0}
+        started = time.perf_counter()
+        rows_at_start = checkpoint["rows"]
+
+        def prepare(chunk: tuple) -> tuple:
+            first_row, rows, row_errors = chunk
+            return first_row, rows, *_prepare_members(rows, row_errors)
+
+        reject_file, reject_writer = member_import.open_reject_file(reject_path, checkpoint["reject_size"])
+        try:
+            chunks = member_import.read_chunks(file_path, import_format, checkpoint["rows"])
+            for first_row, rows, row_errors, prepared in run_pipeline(chunks, prepare):
+                member_ids = _insert_members(prepared, row_errors)
+                member_import.write_rejects(reject_writer, first_row, rows, row_errors)
+                reject_file.flush()
+                progress = dict(checkpoint, rows=first_row - 1 + len(rows),
+                                created=checkpoint["created"] + len(member_ids),
+                                rejected=checkpoint["rejected"] + len(row_errors),
+                                reject_size=os.fstat(reject_file.fileno()).st_size)
+                # committed together with the members, so after a crash a chunk is either done completely or not at all
+                _save_import_progress(file_path, progress)
+                _pool.commit()
+                checkpoint = progress
+        except Exception as e:
+            _pool.rollback()
+            reject_file.close()
+            if not checkpoint["reject_size"]:
+                os.remove(reject_path)  # nothing in it is saved, the next try starts a new one
+            self.errors.append(f"The import stopped at row {checkpoint['rows'] + 1} ({e}), "
+                               "import the same file again to continue.")
+            _logger.log(self.session.user.username, "Failed to import members", str(e), False)
+            return None
+        finally:
+            reject_file.close()
+
+        _pool.execute("DELETE FROM member_imports WHERE file_path = ?", (os.path.abspath(file_path),))
+        _pool.commit()
+        if not checkpoint["rejected"]:
+            os.remove(reject_path)
+            reject_path = None
+        seconds = time.perf_counter() - started
+        _logger.log(self.session.user.username, "Imported members",
+                    f"file: {os.path.basename(file_path)}, created: {checkpoint['created']}, "
+                    f"rejected: {checkpoint['rejected']}", False)
+        rows = checkpoint["rows"] - rows_at_start
+        return {"created": checkpoint["created"], "rejected": checkpoint["rejected"], "reject_path": reject_path,
+                "seconds": round(seconds, 3), "rows_per_second": round(rows / seconds) if seconds else rows}
+
+    @authorize(UserType.ADMIN)
+    def export_members(self, export_format: str = "csv", fields: list[str] = None) -> dict | None:
+        """
+        Exports the decrypted members into a new file in the exports folder, see member_export.py
+        :param fields: the fields to export besides the id (named like the arguments of `create_member`), all if None.
+            The fields that are not exported are not decrypted (unless the member is stored as a row level record)
+        :return: the path of the file, the amount of exported members, the seconds it took and the members per second
+        """
+        unknown = [field for field in fields or () if field not in member_import.IMPORT_FIELDS]
+        # the fields are always exported in the same order, no matter the order they are given in
+        fields = tuple(field for field in member_import.IMPORT_FIELDS if fields is None or field in fields)
+        if export_format not in member_export.EXPORT_FORMATS:
+            self.errors.append(f"Format must be one of: {', '.join(member_export.EXPORT_FORMATS)}")
+        if unknown:
+            self.errors.append(f"Unknown fields: {', '.join(unknown)}")
+        if self.errors:
+            _logger.log(self.session.user.username, "Failed to export members", "Invalid input data", False)
+            return None
+
+        if not os.path.exists(EXPORT_PATH):
+            os.mkdir(EXPORT_PATH)
+        file_path = os.path.join(EXPORT_PATH,
+                                 f'members_{datetime.now().strftime("%Y-%m-%d_%H-%M-%S")}.{export_format}')
+        try:
+            chunks = _iter_member_rows(fields, member_export.CHUNK_SIZE)
+            result = member_export.export_members(chunks, file_path, export_format, fields)
+        except Exception as e:
+            self.errors.append("Failed to export members.")
+            _logger.log(self.session.user.username, "Failed to export members", str(e), True)
+            return None
+        # exporting the decrypted members is a sensitive action, so it is logged with what has been exported
+        _logger.log(self.session.user.username, "Exported members",
+                    f"members: {result['exported']}, fields: {', '.join(fields)}", False)
+        return {"path": file_path, **result}
 
     @authorize(UserType.CONSULTANT)
     def update_member(self, member_id: int, first_name: str, last_name: str, age: str, gender: str, weight: str,
@@ -304,8 +953,12 @@ class Database:
         if not self._validate_member_data(first_name, last_name, age, gender, weight, street,
                                           house_number, zip_code, city, email, phone):
             return
+        if _email_in_use(email, member_id):
+            self.errors.append("A member with this email already exists.")
+            _logger.log(self.session.user.username, "Failed to update member", "Email already exists", False)
+            return
 
-        _db_cursor.execute(
+        _pool.execute(
             """
             UPDATE members SET
                 first_name = ?,     last_name = ?,
@@ -313,23 +966,18 @@ class Database:
                 weight = ?,         street = ?,
                 house_number = ?,   zip = ?,
                 city = ?,           email = ?,
-                phone = ?
+                phone = ?,          record = ?,
+                email_idx = ?
             WHERE  id = ?
             """, (
-                encrypt_data_str(first_name),
-                encrypt_data_str(last_name),
-                encrypt_data_str(age),
-                encrypt_data_str(gender),
-                encrypt_data_str(weight),
-                encrypt_data_str(street),
-                encrypt_data_str(house_number),
-                encrypt_data_str(zip_code),
-                encrypt_data_str(city),
-                encrypt_data_str(email),
-                encrypt_data_str(phone),
+                *_member_values(first_name, last_name, age, gender, weight, street,
+                                house_number, zip_code, city, email, phone),
+                _email_index(email),
                 member_id)
         )
-        _db_connection.commit()
+        _pool.commit()
+        _member_cache.put(member_id, Member(member_id, first_name, last_name, age, gender, weight, street,
+                                            house_number, zip_code, city, email, phone))
 
     # =================== #
     #      USER LOGIC     #
@@ -347,7 +995,7 @@ class Database:
         if self._get_user_from_id(id).type == UserType.CONSULTANT:
             return self._update_user(id, first_name, last_name, username)
         self.errors.append("User is not a consultant.")
-        _logger.log(_current_user.username, "Failed to update user",
+        _logger.log(self.session.user.username, "Failed to update user",
                     f"This user is not authorized to update a consultant", True)
 
     @authorize(UserType.SUPER_ADMIN)
@@ -355,7 +1003,7 @@ class Database:
         if self._get_user_from_id(id).type == UserType.ADMIN:
             return self._update_user(id, first_name, last_name, username)
         self.errors.append("User is not an admin.")
-        _logger.log(_current_user.username, "Failed to update user",
+        _logger.log(self.session.user.username, "Failed to update user",
                     f"This user is not authorized to update an admin", True)
 
     def _update_user(self, id, first_name, last_name, username) -> None:
@@ -372,24 +1020,32 @@ class Database:
             if not username_valid:
                 self.errors.append("Username must be between 8 and 10 characters long and can only contain letters,"
                                    " numbers, and underscores.")
-            _logger.log(_current_user.username, "Failed to update user",
+            _logger.log(self.session.user.username, "Failed to update user",
                         f"User ID: {id} because of invalid input", False)
             return
 
-        _db_cursor.execute(
+        if [user for user in _get_users_by_username(username) if user.id != id]:
+            self.errors.append("A user with this username already exists.")
+            _logger.log(self.session.user.username, "Failed to update user",
+                        f"User ID: {id} because the username already exists", False)
+            return
+
+        _pool.execute(
             """
             UPDATE users
-            SET first_name = ?, last_name = ?, username = ?
+            SET first_name = ?, last_name = ?, username = ?, username_idx = ?
             WHERE id = ?
             """, (
-                encrypt_data_str(first_name),
-                encrypt_data_str(last_name),
-                encrypt_data_str(username),
+                encrypt_data(first_name),
+                encrypt_data(last_name),
+                encrypt_data(username),
+                blind_index(username),
                 id
             )
         )
-        _db_connection.commit()
-        _logger.log(_current_user.username, "Updated user", f"User ID: {id}", False)
+        _pool.commit()
+        _user_cache.invalidate(id)
+        _logger.log(self.session.user.username, "Updated user", f"User ID: {id}", False)
 
     @authorize(UserType.ADMIN)
     def create_consultant(self, username: str, password: str, first_name: str, last_name: str) -> None:
@@ -417,40 +1073,40 @@ class Database:
             if not password_valid:
                 self.errors.append("Password must be between 8 and 20 characters long and must contain at least one"
                                    " uppercase letter, one lowercase letter, one number, and one special character.")
-            _logger.log(_current_user.username, "Failed to create user",
+            _logger.log(self.session.user.username, "Failed to create user",
                         "because of invalid input", False)
             return
 
-        all_users = _get_all_users()
-        if [user for user in all_users if user.username == username]:
+        if _get_users_by_username(username):
             self.errors.append("A user with this username already exists.")
-            _logger.log(_current_user.username, "Failed to create user",
+            _logger.log(self.session.user.username, "Failed to create user",
                         "because user already exists", False)
             return  # user already exists
 
-        _db_cursor.execute(
+        _pool.execute(
             """
-            INSERT INTO users (username, password, type, first_name, last_name, registration_date)
-            VALUES (?, ?, ?, ?, ?, ?)
+            INSERT INTO users (username, password, type, first_name, last_name, registration_date, username_idx)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
             """,
             (
-                encrypt_data_str(username),
-                encrypt_data_str(hash_password(password)),
-                encrypt_data_str(str(type.value)),
-                encrypt_data_str(first_name),
-                encrypt_data_str(last_name),
-                encrypt_data_str(time.strftime("%Y-%m-%d"))
+                encrypt_data(username),
+                encrypt_data(hash_password(password)),
+                encrypt_data(str(type.value)),
+                encrypt_data(first_name),
+                encrypt_data(last_name),
+                encrypt_data(time.strftime("%Y-%m-%d")),
+                blind_index(username)
             )
         )
-        _db_connection.commit()
-        _logger.log(_current_user.username, "Created user", f"username: {username}", False)
+        _pool.commit()
+        _logger.log(self.session.user.username, "Created user", f"username: {username}", False)
 
     @authorize(UserType.ADMIN)
     def delete_consultant(self, user_id: int) -> None:
         if self._get_user_from_id(user_id).type == UserType.CONSULTANT:
             return self._delete_user(user_id)
         self.errors.append("User is not a consultant.")
-        _logger.log(_current_user.username, "Tried deleting a consultant",
+        _logger.log(self.session.user.username, "Tried deleting a consultant",
                     "This user is not authorized to delete a consultant", True)
 
     @authorize(UserType.SUPER_ADMIN)
@@ -458,57 +1114,60 @@ class Database:
         if self._get_user_from_id(user_id).type == UserType.ADMIN:
             return self._delete_user(user_id)
         self.errors.append("User is not an admin.")
-        _logger.log(_current_user.username, "Tried deleting an admin",
+        _logger.log(self.session.user.username, "Tried deleting an admin",
                     "This user is not authorized to delete an admin", True)
 
     def _delete_user(self, user_id: int) -> None:
-        _db_cursor.execute("DELETE FROM users WHERE id = ?", (user_id,))
-        _db_connection.commit()
-        _logger.log(_current_user.username, "Deleted user", f"User ID: {user_id}", False)
+        _pool.execute("DELETE FROM users WHERE id = ?", (user_id,))
+        _pool.commit()
+        _user_cache.invalidate(user_id)
+        _logger.log(self.session.user.username, "Deleted user", f"User ID: {user_id}", False)
 
     def edit_my_password(self, old_password: str, new_password: str) -> None:
-        if not _current_user:
+        if not is_authorized(self.session, UserType.CONSULTANT):  # every user is at least a consultant
             self.errors.append("You must be logged in to change your password.")
             _logger.log("...", "Failed to change password", "User is not logged in", True)
             return
 
-        if not compare_passwords(old_password, _current_user.password_hash):
+        if not compare_passwords(old_password, self.session.user.password_hash):
             self.errors.append("Incorrect password.")
-            if _logger.change_attempts > 2:
-                _logger.log(_current_user.username, "Failed to change password",
+            if self.session.change_attempts > 2:
+                _logger.log(self.session.user.username, "Failed to change password",
                             "Old password is incorrect after more than 3 failed attempts", True)
             else:
-                _logger.log(_current_user.username, "Failed to change password", "Old password is incorrect", False)
-            _logger.change_attempts += 1
+                _logger.log(self.session.user.username, "Failed to change password", "Old password is incorrect", False)
+            self.session.change_attempts += 1
             return
 
         password_valid = is_valid_password(new_password)
         if not password_valid:
             self.errors.append("Password must be between 8 and 20 characters long and must contain at least "
                                "one uppercase letter, one lowercase letter, one number, and one special character.")
-            _logger.log(_current_user.username, "Failed to change password", "New password is invalid", False)
+            _logger.log(self.session.user.username, "Failed to change password", "New password is invalid", False)
             return
 
-        _db_cursor.execute(
+        _pool.execute(
             """
             UPDATE users
             SET password = ?
             WHERE id = ?
             """,
             (
-                encrypt_data_str(hash_password(new_password)),
-                _current_user.id
+                encrypt_data(hash_password(new_password)),
+                self.session.user.id
             )
         )
-        _db_connection.commit()
-        _logger.log(_current_user.username, "Changed its own password", "", False)
-        _logger.change_attempts = 0
+        _pool.commit()
+        _user_cache.invalidate(self.session.user.id)
+        # otherwise the session would still compare against the old password
+        self.session.user = self._get_user_from_id(self.session.user.id)
+        _logger.log(self.session.user.username, "Changed its own password", "", False)
+        self.session.change_attempts = 0
 
     def _get_user_from_id(self, id: int) -> User:
         if isinstance(id, int):
-            _db_cursor.execute("SELECT * FROM users WHERE id = ?", (id,))
-            user = _db_cursor.fetchone()
-            return User(user[0], *tuple(decrypt_data(user_data) for user_data in user[1:]))
+            users = _load_users([id])
+            return users[0] if users else None
         return None
 
     @authorize(UserType.ADMIN)
@@ -516,7 +1175,7 @@ class Database:
         if self._get_user_from_id(user_id).type == UserType.CONSULTANT:
             return self._reset_password(user_id, new_password)
         self.errors.append("User is not a consultant.")
-        _logger.log(_current_user.username, "Tried resetting password",
+        _logger.log(self.session.user.username, "Tried resetting password",
                     "This user is not authorized to reset passwords of consultants", True)
 
     @authorize(UserType.SUPER_ADMIN)
@@ -524,7 +1183,7 @@ class Database:
         if self._get_user_from_id(user_id).type == UserType.ADMIN:
             return self._reset_password(user_id, new_password)
         self.errors.append("User is not an admin.")
-        _logger.log(_current_user.username, "Tried resetting password",
+        _logger.log(self.session.user.username, "Tried resetting password",
                     "This user is not authorized to reset password of admins", True)
 
     def _reset_password(self, user_id: int, new_password: str) -> None:
@@ -532,21 +1191,22 @@ class Database:
         if not password_valid:
             self.errors.append('Password must be between 8 and 20 characters long and must contain at least one '
                                'uppercase letter, one lowercase letter, one number, and one special character.')
-            _logger.log(_current_user.username, 'Failed to reset password', 'New password is invalid', False)
+            _logger.log(self.session.user.username, 'Failed to reset password', 'New password is invalid', False)
             return
-        _db_cursor.execute(
+        _pool.execute(
             '''
             UPDATE users
             SET password = ?
             WHERE id = ?
             ''',
             (
-                encrypt_data_str(hash_password(new_password)),
+                encrypt_data(hash_password(new_password)),
                 user_id
             )
         )
-        _db_connection.commit()
-        _logger.log(_current_user.username, 'Reset password', f'User ID: {user_id}', False)
+        _pool.commit()
+        _user_cache.invalidate(user_id)
+        _logger.log(self.session.user.username, 'Reset password', f'User ID: {user_id}', False)
 
     # =================== #
     #    BACKUP LOGIC     #
@@ -558,14 +1218,19 @@ class Database:
             os.mkdir(BACKUP_PATH)
 
         try:
-            _logger.log(_current_user.username, "Created backup", "", False)
+            _logger.log(self.session.user.username, "Created backup", "", False)
             with zipfile.ZipFile(
                     f'{BACKUP_PATH}\\backup_{datetime.now().strftime("%Y-%m-%d_%H-%M-%S")}.zip', 'w') as zip:
+                # the last commits can still be in the WAL file, they have to be in the database file itself first
+                _pool.checkpoint()
                 zip.write(DB_PATH)
-                zip.write(LOGS_PATH)
+                # the logs are split over the active log file, the sealed segments, the archives and their header/index.
+                # The archives have to be in there as well, the segments index that is restored still lists them
+                for log_file in _logger.get_files(include_archive=True):
+                    zip.write(log_file)
         except Exception as e:
             self.errors.append("Failed to create backup.")
-            _logger.log(_current_user.username, "Failed to create backup", str(e), True)
+            _logger.log(self.session.user.username, "Failed to create backup", str(e), True)
 
     @authorize(UserType.ADMIN)
     def get_backups(self) -> list[str] | None:
@@ -581,20 +1246,84 @@ class Database:
             return
 
         try:
-            _logger.log(_current_user.username, "Applied backup", f"applied backup: {backup_name}", False)
+            _logger.log(self.session.user.username, "Applied backup", f"applied backup: {backup_name}", False)
             with zipfile.ZipFile(f"{BACKUP_PATH}\\{backup_name}", 'r') as zip:
+                # the open connections (and their WAL file) belong to the old database, they can't be used with the
+                # restored one, the next query opens new connections
+                _pool.close()
+                for wal_file in (DB_PATH + "-wal", DB_PATH + "-shm"):
+                    if os.path.exists(wal_file):
+                        os.remove(wal_file)
                 zip.extractall()
+            clear_caches()  # everything could be different now
         except Exception as e:
             self.errors.append("Failed to apply backup.")
-            _logger.log(_current_user.username, "Failed to apply backup", str(e), True)
+            _logger.log(self.session.user.username, "Failed to apply backup", str(e), True)
 
-    # We keep track what the last time was that we viewed the log by just adding a hidden log to the top of the log list
-    # With this we can differentiate between any log comming after/before the last time somem viewed the log
+    # We keep track of the last log that has been viewed (and how many risks came in after it) in the log header
+    # With this we can differentiate between any log comming after/before the last time somem viewed the log.
+    # The log viewer counts the logs and then only reads the page that is shown
     @authorize(UserType.ADMIN)
-    def get_logs(self) -> list[LogEntry]:
-        logs = _logger.get_all_logs()
+    def count_logs(self) -> int:
+        count = _logger.count_records()
         _logger.flag_logs_as_viewed()
-        return logs
+        return count
+
+    @authorize(UserType.ADMIN)
+    def get_logs_page(self, page: int, size: int, newest_first: bool = True) -> list[LogEntry]:
+        return _logger.read_page(page, size, newest_first)
+
+    @authorize(UserType.ADMIN)
+    def query_logs(self, username: str = None, description: str = None, suspicious: bool = None,
+                   start: str = None, end: str = None, include_archive: bool = False) -> list[LogEntry]:
+        """
+        Only the logs that match all the given filters are decrypted, see Logger.query for the formats
+        """
+        return _logger.query(username, description, suspicious, start, end, include_archive)
+
+    @authorize(UserType.ADMIN)
+    def follow_logs(self, cursor: dict = None) -> tuple[list[LogEntry], dict]:
+        """
+        :param cursor: the cursor that was returned last time, or None to start at the newest log
+        :return: the logs that came in after the cursor, and the cursor for the next time
+        """
+        if cursor is None:
+            return [], _logger.follow_cursor()
+        logs, cursor = _logger.read_new_logs(cursor)
+        if logs:
+            _logger.flag_logs_as_viewed()  # they are shown right away, so they are not unread anymore
+        return logs, cursor
+
+    @authorize(UserType.ADMIN)
+    def export_logs(self, export_format: str = "csv", start_date: str = None, end_date: str = None,
+                    suspicious: bool = None) -> dict | None:
+        """
+        Exports the decrypted logs into a new file in the exports folder, see log_export.py
+        :return: the path of the file, the amount of exported logs, the seconds it took and the logs per second
+        """
+        if export_format not in log_export.EXPORT_FORMATS:
+            self.errors.append(f"Format must be one of: {', '.join(log_export.EXPORT_FORMATS)}")
+        for date in (start_date, end_date):
+            if date is not None and not is_valid_date(date):
+                self.errors.append(f"Invalid date '{date}', use yyyy-mm-dd")
+        if self.errors:
+            _logger.log(self.session.user.username, "Failed to export logs", "Invalid input data", False)
+            return None
+
+        if not os.path.exists(EXPORT_PATH):
+            os.mkdir(EXPORT_PATH)
+        file_path = os.path.join(EXPORT_PATH, f'logs_{datetime.now().strftime("%Y-%m-%d_%H-%M-%S")}.{export_format}')
+        try:
+            result = log_export.export_logs(_logger, file_path, export_format, start_date, end_date, suspicious)
+        except Exception as e:
+            self.errors.append("Failed to export logs.")
+            _logger.log(self.session.user.username, "Failed to export logs", str(e), True)
+            return None
+        # exporting the decrypted logs is a sensitive action, so it is logged with what has been exported
+        _logger.log(self.session.user.username, "Exported logs",
+                    f"logs: {result['exported']}, from: {start_date}, until: {end_date}, suspicious: {suspicious}",
+                    False)
+        return {"path": file_path, **result}
 
     @authorize(UserType.ADMIN)
     def log_risk_detected(self) -> bool:
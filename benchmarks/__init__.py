@@ -0,0 +1,5 @@
+# Benchmarks for the crypto, persistence and logging hot paths.
+# Run them from the root of the project (so the modules of the app can be imported):
+#   python -m benchmarks --sizes 1000,10000 --output bench_results.json
+#   python -m benchmarks --sizes 1000 --baseline bench_results.json
+# Everything runs on synthetic data in a temporary directory, so your own database, logs and keys are never touched.
@@ -0,0 +1,71 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from benchmarks import suite
+
+
+def _compare(results: dict, baseline: dict, threshold: float) -> bool:
+    """
+    Prints how the results compare to the baseline (the median timings)
+    :return: True if nothing got slower than the threshold allows
+    """
+    ok = True
+    for size, benchmarks in results.items():
+        for name, timing in benchmarks.items():
+            base = baseline.get("results", {}).get(size, {}).get(name)
+            if not base or not base["median"]:
+                continue
+            ratio = timing["median"] / base["median"]
+            marker = ""
+            if ratio > threshold:
+                marker = "  <-- slower"
+                ok = False
+            print(f"{size:>8} {name:<28} {base['median']:10.4f}s -> {timing['median']:10.4f}s  x{ratio:.2f}{marker}")
+    return ok
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks",
+                                     description="Benchmarks the crypto, persistence and logging hot paths")
+    parser.add_argument("--sizes", default="1000",
+                        help="comma separated amounts of generated members/log entries (default: 1000)")
+    parser.add_argument("--repeat", type=int, default=3, help="how often every benchmark is repeated (default: 3)")
+    parser.add_argument("--output", default="bench_results.json", help="where to write the results (json)")
+    parser.add_argument("--baseline", help="results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="a benchmark counts as slower when its median is this many times the baseline")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    results = suite.run(sizes, args.repeat)
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "sizes": sizes,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r") as file:
+            baseline = json.load(file)
+        if not _compare(results, baseline, args.threshold):
+            return 1
+    else:
+        for size, benchmarks in results.items():
+            for name, timing in benchmarks.items():
+                print(f"{size:>8} {name:<28} {timing['median']:10.4f}s")
+    return 0
+
+
+sys.exit(main())
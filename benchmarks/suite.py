@@ -0,0 +1,101 @@
+import os
+import statistics
+import tempfile
+import time
+import backend
+import encryption
+from backend import setup_database, close_database, clear_caches, Database
+from classes import preload
+from logging import Logger
+from benchmarks import synthetic
+
+if __name__ == "__main__":
+    raise SystemExit("This file is not meant to be run directly. Please run: python -m benchmarks")
+
+
+def _measure(function, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return {"min": min(timings), "median": statistics.median(timings), "repeat": repeat}
+
+
+def _logged_in_database() -> Database:
+    db = Database()
+    db.login_user("super_admin", "Admin_123?")
+    return db
+
+
+def _encryption_benchmarks(size: int, repeat: int) -> dict:
+    values = [f"value number {index}" for index in range(size)]
+    encrypted = encryption.encrypt_many(values)
+    legacy = [encryption._rsa_encrypt(value.encode()) for value in values[:min(size, 200)]]
+    return {
+        "encrypt_data": _measure(lambda: [encryption.encrypt_data(value) for value in values], repeat),
+        "decrypt_data": _measure(lambda: [encryption.decrypt_data(value) for value in encrypted], repeat),
+        "decrypt_many": _measure(lambda: encryption.decrypt_many(encrypted), repeat),
+        "encrypt_many": _measure(lambda: encryption.encrypt_many(values), repeat),
+        # the old RSA ciphertexts are a lot slower, so these are only measured on (at most) 200 values
+        "decrypt_legacy_rsa_200": _measure(lambda: [encryption.decrypt_data(value) for value in legacy], repeat),
+    }
+
+
+def _backend_benchmarks(repeat: int, usernames: list[str]) -> dict:
+    db = _logged_in_database()
+    logger = backend._logger
+
+    def get_all_members_cold():
+        clear_caches()
+        preload(db.get_all_members(), "first_name", "last_name", "age", "email")
+
+    def get_all_members_warm():
+        preload(db.get_all_members(), "first_name", "last_name", "age", "email")
+
+    def login_user():
+        login_db = Database()
+        login_db.login_user(usernames[-1], synthetic.USER_PASSWORD)
+        login_db.logout_user()
+
+    results = {
+        "get_all_members_cold": _measure(get_all_members_cold, repeat),
+        "get_all_members_warm": _measure(get_all_members_warm, repeat),
+        # the member list without a search only loads the page that is shown, this should not depend on the size
+        "get_members_page_cold": _measure(lambda: (clear_caches(), preload(db.get_members_page(None, 9), "first_name",
+                                                                           "last_name", "age", "email")), repeat),
+        "get_all_users_cold": _measure(lambda: (clear_caches(), preload(db.get_all_users(), "username")), repeat),
+        "logger_startup": _measure(lambda: Logger(logger.path), repeat),
+        "get_all_logs": _measure(logger.get_all_logs, repeat),
+        "new_risk_detected": _measure(logger.new_risk_detected, repeat),
+        "query_logs_by_user": _measure(lambda: logger.query(username="user_00001"), repeat),
+    }
+    # Note that logging in has a deliberate delay of 0.2 seconds (against brute forcing) and bcrypt is slow on purpose
+    db.logout_user()
+    results["login_user"] = _measure(login_user, repeat)
+    return results
+
+
+def run(sizes: list[int], repeat: int = 3) -> dict:
+    """
+    Runs all the benchmarks for every size, every size gets a fresh database, log file and keys
+    in its own temporary directory.
+    :param sizes: the amount of members, users and log entries to generate (users are capped at 1000)
+    :return: the results per size, per benchmark: {"1000": {"get_all_members_cold": {"min": .., "median": ..}}}
+    """
+    results = {}
+    original_directory = os.getcwd()
+    for size in sizes:
+        with tempfile.TemporaryDirectory(prefix="um_benchmark_") as directory:
+            os.chdir(directory)
+            try:
+                setup_database()
+                synthetic.add_members(size)
+                usernames = synthetic.add_users(min(size, 1000))
+                synthetic.add_logs(size)
+                results[str(size)] = {**_encryption_benchmarks(size, repeat),
+                                      **_backend_benchmarks(repeat, usernames)}
+            finally:
+                close_database()
+                os.chdir(original_directory)
+    return results
@@ -0,0 +1,65 @@
+import random
+import time
+import backend
+from classes import UserType
+from encryption import encrypt_data, hash_password, blind_index
+from validation import CITY_LIST, GENDER_LIST
+
+if __name__ == "__main__":
+    raise SystemExit("This file is not meant to be run directly. Please run: python -m benchmarks")
+
+# this file fills the (empty) database and log file of the current directory with fake data.
+# It talks to the internals of the backend directly, since going through `Database` for every row would take forever
+
+FIRST_NAMES = ["John", "Jane", "Alice", "Bob", "Charlie", "Diana", "Edward", "Fiona", "George", "Helen"]
+LAST_NAMES = ["Doe", "Smith", "Johnson", "Brown", "Evans", "Wilson", "Garcia", "Harrison", "Martinez", "Lopez"]
+STREETS = ["Main street", "Elm street", "Pine Lane", "Maple", "Cedar", "Oak street", "Birch Lane"]
+USER_PASSWORD = "Benchmark_123?"
+
+
+def add_members(count: int, seed: int = 1) -> list[int]:
+    """
+    :return: the ids of the created members
+    """
+    rng = random.Random(seed)
+    rows = []
+    for index in range(count):
+        member_id = 2_400_000_000 + index
+        email = f"member{index}@example.com"
+        values = (rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), str(rng.randint(18, 90)),
+                  rng.choice(GENDER_LIST), str(rng.randint(50, 120)), rng.choice(STREETS), str(rng.randint(1, 200)),
+                  f"{rng.randint(1000, 9999)}AB", rng.choice(CITY_LIST), email, f"{rng.randint(0, 99999999):08}")
+        rows.append((member_id, *backend._member_values(*values), backend._email_index(email)))
+
+    backend._pool.executemany(
+        f"""
+        INSERT INTO members (id, {', '.join(backend.MEMBER_FIELDS)}, record, email_idx)
+        VALUES ({', '.join('?' * (len(backend.MEMBER_FIELDS) + 3))})
+        """, rows)
+    backend._pool.commit()
+    return [row[0] for row in rows]
+
+
+def add_users(count: int) -> list[str]:
+    """
+    All users get the same password, since bcrypt is (on purpose) way too slow to hash thousands of passwords
+    :return: the usernames of the created users
+    """
+    password_hash = hash_password(USER_PASSWORD)
+    usernames = [f"user_{index:05}" for index in range(count)]
+    backend._pool.executemany(
+        """
+        INSERT INTO users (username, password, type, first_name, last_name, registration_date, username_idx)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, [(encrypt_data(username), encrypt_data(password_hash), encrypt_data(str(UserType.CONSULTANT.value)),
+               encrypt_data("Bench"), encrypt_data("User"), encrypt_data(time.strftime("%Y-%m-%d")),
+               blind_index(username)) for username in usernames])
+    backend._pool.commit()
+    return usernames
+
+
+def add_logs(count: int, suspicious_every: int = 50) -> None:
+    logger = backend._logger
+    for index in range(count):
+        logger.log(f"user_{index % 100:05}", "Benchmark entry", f"entry {index}", index % suspicious_every == 0)
+    logger.flush()
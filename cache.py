@@ -0,0 +1,52 @@
+from collections import OrderedDict
+from threading import Lock
+
+if __name__ == "__main__":
+    raise SystemExit("This file is not meant to be run directly. Please run the main script called um_members.py")
+
+
+class LRUCache:
+    """
+    A dictionary with a maximum size. When it is full, the item that has not been used for the longest time is removed.
+    It also counts the hits and misses, so you can see if the size is big enough.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._items: OrderedDict = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        """
+        :return: the cached value, or None if the key is not in the cache
+        """
+        with self._lock:
+            if key not in self._items:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, value) -> None:
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def invalidate(self, key) -> None:
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {"size": len(self._items), "max_size": self.max_size, "hits": self.hits, "misses": self.misses,
+                    "hit_rate": self.hits / total if total else 0.0}
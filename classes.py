@@ -1,21 +1,139 @@
+import json
+import time
 from enum import Enum
+from encryption import decrypt_data, decrypt_many
 
 # IMPORTANT!
-#   Note that every data in the database must be saved as a string 
+#   Note that every data in the database must be saved as a string
 #   (except the id, since that is generated by the db itself)
 #   That's because we encrypt and decrypt, which only works on strings
 
+# The Member and User objects can be created straight from the encrypted values in the database.
+# Then every field keeps the ciphertext until the first time it is read, and only then it is decrypted (once).
+# This way a page that only shows a few fields, only pays for decrypting those fields.
+
+
+class _Ciphertext:
+    __slots__ = ("data",)
+
+    def __init__(self, data: str | bytes) -> None:
+        self.data = data
+
+
+class _EncryptedRecord:
+    """
+    A row level record (all fields of a row encrypted together as a json list). It is decrypted only once,
+    no matter how many of its fields are read.
+    """
+    __slots__ = ("data", "values")
+
+    def __init__(self, data: str | bytes) -> None:
+        self.data = data
+        self.values: list[str] | None = None
+
+    def get_values(self) -> list[str]:
+        if self.values is None:
+            self.values = json.loads(decrypt_data(self.data))
+        return self.values
+
+
+class _RecordField:
+    __slots__ = ("record", "index")
+
+    def __init__(self, record: _EncryptedRecord, index: int) -> None:
+        self.record = record
+        self.index = index
+
+
+class _LazyField:
+    """
+    A field that decrypts (and converts) its value the first time it is read, and then remembers it.
+    The value itself is stored in the slot with the same name, but with an underscore in front.
+    """
+
+    def __init__(self, convert=str) -> None:
+        self.convert = convert
+        self.slot = ""
+
+    def __set_name__(self, owner, name: str) -> None:
+        self.slot = "_" + name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        value = getattr(instance, self.slot)
+        if isinstance(value, _Ciphertext):
+            value = self.set_plain(instance, decrypt_data(value.data))
+        elif isinstance(value, _RecordField):
+            value = self.set_plain(instance, value.record.get_values()[value.index])
+        return value
+
+    def __set__(self, instance, value) -> None:
+        if isinstance(value, (_Ciphertext, _RecordField)):
+            setattr(instance, self.slot, value)
+        else:
+            self.set_plain(instance, value)
+
+    def set_plain(self, instance, value):
+        value = self.convert(value)
+        setattr(instance, self.slot, value)
+        return value
+
+
+def _lazy_fields(cls) -> list[str]:
+    return [name for name, value in vars(cls).items() if isinstance(value, _LazyField)]
+
+
+def preload(entities: list, *fields: str) -> None:
+    """
+    Decrypts these fields of all the entities in one batch (spread over the worker pool), instead of one by one
+    the moment they are read. Fields that are already decrypted are skipped.
+    :param entities: a list of Members or Users
+    :param fields: the names of the fields that will be read
+    """
+    records: dict[int, _EncryptedRecord] = {}
+    pending: list[tuple[object, _LazyField, str | bytes]] = []
+    for entity in entities:
+        for name in fields:
+            field: _LazyField = getattr(type(entity), name)
+            value = getattr(entity, field.slot)
+            if isinstance(value, _Ciphertext):
+                pending.append((entity, field, value.data))
+            elif isinstance(value, _RecordField) and value.record.values is None:
+                records[id(value.record)] = value.record
+
+    decrypted = decrypt_many([record.data for record in records.values()] + [data for _, _, data in pending])
+    for record, plain in zip(records.values(), decrypted):
+        record.values = json.loads(plain)
+    for (entity, field, _), plain in zip(pending, decrypted[len(records):]):
+        field.set_plain(entity, plain)
+
 
 class Member:
+    __slots__ = ("id", "_first_name", "_last_name", "_age", "_gender", "_weight", "_street_name", "_house_number",
+                 "_zip_code", "_city", "_email", "_phone")
+
+    first_name = _LazyField()
+    last_name = _LazyField()
+    age = _LazyField(int)
+    gender = _LazyField()
+    weight = _LazyField(float)
+    street_name = _LazyField()
+    house_number = _LazyField()
+    zip_code = _LazyField()
+    city = _LazyField()
+    email = _LazyField()
+    phone = _LazyField()
+
     def __init__(self, id: int, first_name: str, last_name: str, age: str, gender: str,
                  weight: str, street_name: str, house_number: str, zip_code: str,
                  city: str, email: str, phone: str) -> None:
         self.id: int = id
         self.first_name: str = first_name
         self.last_name: str = last_name
-        self.age: int = int(age)
+        self.age: int = age
         self.gender: str = gender
-        self.weight: float = float(weight)
+        self.weight: float = weight
         self.street_name: str = street_name
         self.house_number: str = house_number
         self.zip_code: str = zip_code
@@ -23,6 +141,21 @@ class Member:
         self.email: str = email
         self.phone: str = phone
 
+    @classmethod
+    def from_encrypted(cls, id: int, *encrypted_fields: str | bytes) -> "Member":
+        """
+        :param encrypted_fields: the separately encrypted fields, in the same order as the constructor
+        """
+        return cls(id, *(_Ciphertext(data) for data in encrypted_fields))
+
+    @classmethod
+    def from_encrypted_record(cls, id: int, encrypted_record: str | bytes) -> "Member":
+        """
+        :param encrypted_record: all the fields encrypted together as a json list, in the same order as the constructor
+        """
+        record = _EncryptedRecord(encrypted_record)
+        return cls(id, *(_RecordField(record, index) for index in range(len(_lazy_fields(cls)))))
+
 
 class UserType(Enum):
     CONSULTANT = 0
@@ -31,16 +164,32 @@ class UserType(Enum):
 
 
 class User:
+    __slots__ = ("id", "_username", "_password_hash", "_type", "_first_name", "_last_name", "_registration_date")
+
+    username = _LazyField()
+    password_hash = _LazyField()
+    type = _LazyField(lambda value: value if isinstance(value, UserType) else UserType(int(value)))
+    first_name = _LazyField()
+    last_name = _LazyField()
+    registration_date = _LazyField()
+
     def __init__(self, id: int, username: str, password_hash: str, type: str,
                  first_name: str, last_name: str, registration_date: str) -> None:
         self.id: int = id
         self.username: str = username
         self.password_hash: str = password_hash
-        self.type: UserType = UserType(int(type))
+        self.type: UserType = type
         self.first_name: str = first_name
         self.last_name: str = last_name
         self.registration_date: str = registration_date
 
+    @classmethod
+    def from_encrypted(cls, id: int, *encrypted_fields: str | bytes) -> "User":
+        """
+        :param encrypted_fields: the separately encrypted fields, in the same order as the constructor
+        """
+        return cls(id, *(_Ciphertext(data) for data in encrypted_fields))
+
     def get_role_name(self) -> str:
         if self.type == UserType.CONSULTANT:
             return 'Consultant'
@@ -50,3 +199,21 @@ class User:
             return 'Super Admin'
         else:
             return 'Unknown'
+
+
+class Session:
+    """
+    A logged in user, this is what `Database.login_user` returns. The backend does not remember who is logged in,
+    every Database object is created with the session of the user that does the action: `Database(session)`.
+    This way one process can serve multiple users at the same time (and they share the caches).
+    """
+    __slots__ = ("user", "started", "change_attempts", "active")
+
+    def __init__(self, user: User) -> None:
+        self.user: User = user
+        self.started: float = time.time()
+        self.change_attempts = 0  # failed attempts to change the password of the user itself
+        self.active = True  # False after logging out, then the session can't be used anymore
+
+    def is_authorized(self, user_type: UserType) -> bool:
+        return self.active and self.user.type.value >= user_type.value
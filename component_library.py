@@ -161,7 +161,26 @@ def paginated_single_select(title: str, options: list[str], persisted_options: d
     :return:  the index of the item that was selected. or negative if it is one of the persisted options
     (e.g. -1 for first persisted option, -2 for second persisted option)
     """
+    return lazy_paginated_single_select(title, len(options), lambda page, size: options[page * size:(page + 1) * size],
+                                        persisted_options, item_interactable, persist_toast)
 
+
+def lazy_paginated_single_select(title: str, total: int, load_page, persisted_options: dict[str, str] = None,
+                                 item_interactable: bool = True, persist_toast: bool = False) -> int:
+    """
+    the same as the paginated_single_select, however, the options are not given up front.
+    Only the page that is shown is asked for, so a huge list doesn't have to be loaded (or decrypted) at once.
+
+    :param title:  the title of the menu
+    :param total:  the total amount of options
+    :param load_page:  a function that gets the page index and the amount of options per page,
+    and returns the options (strings) of that page
+    :param persisted_options: additional options that will always stay no matter the page.
+    :param item_interactable: if the user is allowed to select an item from the list
+    :param persist_toast:  if the toast you created before this single select should persist at refresh
+    :return:  the index of the item that was selected (over all pages). or negative if it is one of the persisted options
+    """
+    persisted_options = persisted_options or {}
     persisted_toasts: list[tuple[str, str]] = _toast.copy() if persist_toast else []
 
     def set_select_toast(message: str, color: str = 'white'):
@@ -172,12 +191,15 @@ def paginated_single_select(title: str, options: list[str], persisted_options: d
 
     max_per_page = 9
     page = 0
-    total_pages = (len(options) + (max_per_page - 1)) // max_per_page
+    total_pages = (total + (max_per_page - 1)) // max_per_page
+    loaded_page, page_options = None, []
 
     skip_first_iteration_clear = True
     while True:
         start_index = page * max_per_page
-        end_index = min(start_index + max_per_page, len(options))
+        if loaded_page != page:  # only loaded when the page changes, not every time the menu is refreshed
+            page_options = load_page(page, max_per_page)
+            loaded_page = page
 
         if skip_first_iteration_clear:
             skip_first_iteration_clear = False
@@ -186,7 +208,7 @@ def paginated_single_select(title: str, options: list[str], persisted_options: d
 
         print(title)
 
-        for index, opt in enumerate(options[start_index:end_index]):
+        for index, opt in enumerate(page_options):
             if item_interactable:
                 print(f"[{index + 1}] {opt}")
             else:
@@ -222,8 +244,7 @@ def paginated_single_select(title: str, options: list[str], persisted_options: d
             choice_index = int(choice)
             real_index = choice_index - 1 + start_index
             # we check if the choice index is on this page
-            # we check if the real index is in the list
-            if 0 < choice_index <= max_per_page and real_index < len(options):
+            if 0 < choice_index <= len(page_options):
                 if item_interactable:
                     return real_index
                 set_select_toast("The items in the list cant be interacted with.", 'red')
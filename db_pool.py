@@ -0,0 +1,146 @@
+import time
+import sqlite3
+import threading
+
+if __name__ == "__main__":
+    raise SystemExit("This file is not meant to be run directly. Please run the main script called um_members.py")
+
+# Every thread gets its own connection to the database (sqlite connections can't be shared between threads safely).
+# The database is in WAL mode: writes go to a separate log file first, so readers keep on reading the last committed
+# state while someone else is writing, instead of waiting for them (or failing with "database is locked").
+# Only two writers at the same time still have to wait for each other, sqlite waits up to BUSY_TIMEOUT itself,
+# and when it still gives up, the statement is tried again a few times with an increasing delay.
+BUSY_TIMEOUT = 2_000  # milliseconds
+BUSY_RETRIES = 5
+BUSY_BACKOFF = 0.05  # seconds before the first retry, it doubles with every retry
+BUSY_BACKOFF_MAX = 1.0
+# negative means in KiB instead of in pages, this is per connection
+CACHE_SIZE = -16_384
+
+
+def _is_busy_error(error: sqlite3.OperationalError) -> bool:
+    message = str(error).lower()
+    return "locked" in message or "busy" in message
+
+
+class ConnectionPool:
+    """
+    Hands out one connection per thread to the same database, and counts how it is used (see `stats`)
+    """
+
+    def __init__(self, database_path: str):
+        self.database_path = database_path
+        self._local = threading.local()
+        self._connections: dict[int, tuple[threading.Thread, sqlite3.Connection]] = {}
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.statements = 0
+        self.commits = 0
+        self.busy_retries = 0
+        self.busy_failures = 0
+        self.busy_wait = 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        # the pool itself makes sure a connection is only used by its own thread,
+        # check_same_thread is turned off only so `close` can close the connections of the other threads
+        connection = sqlite3.connect(self.database_path, timeout=BUSY_TIMEOUT / 1000, check_same_thread=False)
+        # the journal mode is saved in the database file itself, the other settings are per connection
+        self._retry(connection.execute, "PRAGMA journal_mode = WAL")
+        # in WAL mode a commit is still safe after a crash of the app with NORMAL, only a power loss
+        # can undo the last commits (but never corrupt the database), and it saves an fsync on every commit
+        connection.execute("PRAGMA synchronous = NORMAL")
+        connection.execute(f"PRAGMA cache_size = {CACHE_SIZE}")
+        return connection
+
+    def get_connection(self) -> sqlite3.Connection:
+        """
+        :return: the connection of the current thread, it is opened the first time
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._connect()
+            self._local.connection = connection
+            self._local.data_version = None
+            with self._lock:
+                self.opened += 1
+                # the connections of threads that have stopped are not used anymore
+                for thread_id, (thread, old_connection) in list(self._connections.items()):
+                    if not thread.is_alive():
+                        old_connection.close()
+                        del self._connections[thread_id]
+                self._connections[threading.get_ident()] = (threading.current_thread(), connection)
+        return connection
+
+    def _retry(self, function, *args):
+        """
+        Calls the function, and when the database is busy (locked by another writer) tries again after a delay
+        """
+        delay = BUSY_BACKOFF
+        for attempt in range(BUSY_RETRIES + 1):
+            try:
+                return function(*args)
+            except sqlite3.OperationalError as e:
+                if not _is_busy_error(e) or attempt == BUSY_RETRIES:
+                    if _is_busy_error(e):
+                        with self._lock:
+                            self.busy_failures += 1
+                    raise
+            time.sleep(delay)
+            with self._lock:
+                self.busy_retries += 1
+                self.busy_wait += delay
+            delay = min(delay * 2, BUSY_BACKOFF_MAX)
+
+    def execute(self, sql: str, parameters=()) -> sqlite3.Cursor:
+        """
+        :return: the cursor with the result, use fetchone/fetchall on it
+        """
+        with self._lock:
+            self.statements += 1
+        return self._retry(self.get_connection().execute, sql, parameters)
+
+    def executemany(self, sql: str, rows) -> sqlite3.Cursor:
+        with self._lock:
+            self.statements += 1
+        return self._retry(self.get_connection().executemany, sql, rows)
+
+    def commit(self) -> None:
+        with self._lock:
+            self.commits += 1
+        self._retry(self.get_connection().commit)
+
+    def rollback(self) -> None:
+        self.get_connection().rollback()
+
+    def data_changed(self) -> bool:
+        """
+        `PRAGMA data_version` changes when another connection (like seeds.py, or another terminal) commits to the db
+        :return: if it changed since the last time this was called on the current thread (True the first time)
+        """
+        data_version = self.execute("PRAGMA data_version").fetchone()[0]
+        changed = data_version != self._local.data_version
+        self._local.data_version = data_version
+        return changed
+
+    def checkpoint(self) -> None:
+        """
+        Moves everything from the WAL file into the database file itself, so the database file can be copied on its own
+        """
+        self.commit()
+        self._retry(self.get_connection().execute, "PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def close(self) -> None:
+        """
+        Closes the connections of all threads, a thread that uses the pool after this gets a new connection
+        """
+        with self._lock:
+            for _thread, connection in self._connections.values():
+                connection.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"open_connections": len(self._connections), "opened": self.opened,
+                    "statements": self.statements, "commits": self.commits, "busy_retries": self.busy_retries,
+                    "busy_failures": self.busy_failures, "busy_wait": round(self.busy_wait, 3)}
@@ -2,6 +2,15 @@ from cryptography.hazmat.primitives.asymmetric import rsa, padding
 from cryptography.hazmat.primitives import serialization, hashes
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives.asymmetric.rsa import RSAPrivateKey, RSAPublicKey
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.exceptions import InvalidTag
+import os
+import json
+import hmac
+from multiprocessing.pool import Pool, ThreadPool
+import hashlib
+import struct
+import zlib
 import bcrypt
 
 if __name__ == '__main__':
@@ -11,8 +20,35 @@ if __name__ == '__main__':
 # it will generate key pairs, encrypt and decrypt data
 # public key is used to encrypt data and private key is used to decrypt data so the private key should be kept secret
 
+# RSA-OAEP is slow (especially decrypting), and we used to do one RSA operation for every single field.
+# So now we use envelope encryption: the RSA key pair only wraps (encrypts) a random AES key, the "data key",
+# and all the actual data is sealed with AES-GCM using that data key.
+# The wrapped data keys are saved in the keyring file, they can only be unwrapped with the private key.
+#
+# The keyring can hold multiple data keys, each with its own id. New data is always encrypted with the active
+# (newest) key, and the id of the key is saved in the ciphertext. So after a key rotation, everything that is
+# still encrypted with an older key can still be decrypted, while it is slowly re-encrypted in the background.
+
+KEYRING_PATH = 'keyring.json'
+
 _private_key: RSAPrivateKey
 _public_key: RSAPublicKey
+_data_keys: dict[int, bytes] = {}
+_active_key_id: int
+_keyring_mtime: int | None = None  # of the keyring file we have loaded, to notice when another process changed it
+_blind_index_key: bytes
+
+RSA_BLOCK_SIZE = 256  # a 2048-bit RSA ciphertext is always 256 bytes long
+
+# every envelope ciphertext starts with this prefix followed by a version byte.
+# Old RSA ciphertexts have no prefix, so this is how we can still tell them apart (and still decrypt them)
+ENVELOPE_PREFIX = b"UM"
+ENVELOPE_V1 = b"\x01"  # prefix, version, nonce, ciphertext. Always encrypted with the first data key (id 1)
+ENVELOPE_V2 = b"\x02"  # prefix, version, key id, nonce, ciphertext
+_KEY_ID_SIZE = 4
+_NONCE_SIZE = 12
+_TAG_SIZE = 16
+ENVELOPE_OVERHEAD = len(ENVELOPE_PREFIX) + len(ENVELOPE_V2) + _KEY_ID_SIZE + _NONCE_SIZE + _TAG_SIZE
 
 
 # the encoding is PEM, which is a base64 encoded format
@@ -65,6 +101,49 @@ def _generate_rsa_key_pair():
     return private_key, public_key
 
 
+# the data keys are saved wrapped (RSA encrypted), so the keyring is useless without the private key
+def _load_keyring() -> None:
+    global _data_keys, _active_key_id, _blind_index_key, _keyring_mtime
+    with open(KEYRING_PATH, 'r') as keyring_file:
+        keyring = json.load(keyring_file)
+        _keyring_mtime = os.fstat(keyring_file.fileno()).st_mtime_ns
+    _data_keys = {int(key_id): _rsa_decrypt(bytes.fromhex(wrapped)) for key_id, wrapped in keyring["keys"].items()}
+    _active_key_id = keyring["active"]
+    _blind_index_key = _rsa_decrypt(bytes.fromhex(keyring["blind_index"]))
+
+
+def _save_keyring() -> None:
+    global _keyring_mtime
+    keyring = {
+        "active": _active_key_id,
+        "keys": {str(key_id): _rsa_encrypt(data_key).hex() for key_id, data_key in _data_keys.items()},
+        "blind_index": _rsa_encrypt(_blind_index_key).hex(),
+    }
+    # written next to it and then swapped in, so a crash can never leave us with half a keyring
+    with open(KEYRING_PATH + '.tmp', 'w') as keyring_file:
+        json.dump(keyring, keyring_file)
+    os.replace(KEYRING_PATH + '.tmp', KEYRING_PATH)
+    _keyring_mtime = os.stat(KEYRING_PATH).st_mtime_ns
+
+
+def _create_keyring() -> None:
+    global _data_keys, _active_key_id, _blind_index_key
+    try:
+        # before the keyring existed there was only a single data key, this one becomes key 1.
+        # The blind index key used to be derived from it, so we keep it that way to keep the existing indexes valid
+        with open('data_key.bin', 'rb') as key_file:
+            data_key = _rsa_decrypt(key_file.read())
+        _blind_index_key = hmac.new(data_key, b"blind index", hashlib.sha256).digest()
+    except FileNotFoundError:
+        data_key = AESGCM.generate_key(bit_length=256)
+        _blind_index_key = os.urandom(32)
+    _data_keys = {1: data_key}
+    _active_key_id = 1
+    _save_keyring()
+    if os.path.exists('data_key.bin'):
+        os.remove('data_key.bin')  # it is in the keyring now
+
+
 def initialize_keys():
     # load the keys from file
     # if no file, generate keys
@@ -76,34 +155,310 @@ def initialize_keys():
         _private_key, _public_key = _generate_rsa_key_pair()
         _save_key_to_file(_private_key, 'private_key.pem', is_private=True)
         _save_key_to_file(_public_key, 'public_key.pem', is_private=False)
+    try:
+        _load_keyring()
+    except FileNotFoundError:
+        _create_keyring()
 
 
-def encrypt_data(data: str) -> bytes:
-    encrypted_data = _public_key.encrypt(
-        data.encode("utf-8"),
+def rotate_data_key() -> int:
+    """
+    Adds a new data key to the keyring and makes it the active key. The old keys are kept,
+    since there is still data (and backups) encrypted with them.
+    :return: the id of the new key
+    """
+    global _active_key_id
+    _load_keyring()  # another process could have rotated in the meantime
+    _active_key_id = max(_data_keys.keys()) + 1
+    _data_keys[_active_key_id] = AESGCM.generate_key(bit_length=256)
+    _save_keyring()
+    return _active_key_id
+
+
+def get_active_key_id() -> int:
+    return _active_key_id
+
+
+def _get_data_key(key_id: int) -> bytes:
+    if key_id not in _data_keys:
+        # the key could have been added by a key rotation in another process
+        _load_keyring()
+    return _data_keys[key_id]
+
+
+def _rsa_encrypt(data: bytes) -> bytes:
+    return _public_key.encrypt(
+        data,
         padding.OAEP(
             mgf=padding.MGF1(algorithm=hashes.SHA256()),
             algorithm=hashes.SHA256(),
             label=None
         )
     )
-    return encrypted_data
 
 
-def encrypt_data_str(data: str) -> str:
-    return encrypt_data(data).hex()
-
-
-def decrypt_data(encrypted_data: str) -> str:
-    decrypted_data = _private_key.decrypt(
-        bytes.fromhex(encrypted_data),
+def _rsa_decrypt(data: bytes) -> bytes:
+    return _private_key.decrypt(
+        data,
         padding.OAEP(
             mgf=padding.MGF1(algorithm=hashes.SHA256()),
             algorithm=hashes.SHA256(),
             label=None
         )
     )
-    return decrypted_data.decode()
+
+
+def _reload_changed_keyring() -> None:
+    # another process could have rotated the data key, then we must not keep on encrypting with the old one
+    try:
+        mtime = os.stat(KEYRING_PATH).st_mtime_ns
+    except FileNotFoundError:
+        return
+    if mtime != _keyring_mtime:
+        _load_keyring()
+
+
+def _seal(plain: bytes) -> bytes:
+    _reload_changed_keyring()
+    key_id = _active_key_id
+    # the nonce must be unique for every encryption with the same key, 12 random bytes is the standard for AES-GCM
+    nonce = os.urandom(_NONCE_SIZE)
+    return (ENVELOPE_PREFIX + ENVELOPE_V2 + key_id.to_bytes(_KEY_ID_SIZE, "big") + nonce +
+            AESGCM(_data_keys[key_id]).encrypt(nonce, plain, None))
+
+
+def ciphertext_key_id(encrypted_data: str | bytes) -> int | None:
+    """
+    :return: the id of the data key this was encrypted with, or None if it is an old per-field RSA ciphertext
+    """
+    if isinstance(encrypted_data, str):
+        encrypted_data = bytes.fromhex(encrypted_data)
+    prefix_size = len(ENVELOPE_PREFIX)
+    version = encrypted_data[prefix_size:prefix_size + 1]
+    if not encrypted_data.startswith(ENVELOPE_PREFIX) or version not in (ENVELOPE_V1, ENVELOPE_V2):
+        return None
+    if len(encrypted_data) == RSA_BLOCK_SIZE and not _open(encrypted_data)[1]:
+        return None  # only in this (very rare) case we can't tell by just looking at it
+    if version == ENVELOPE_V1:
+        return 1
+    return int.from_bytes(encrypted_data[prefix_size + 1:prefix_size + 1 + _KEY_ID_SIZE], "big")
+
+
+def _open(encrypted_data: bytes) -> tuple[bytes, bool]:
+    """
+    :return: the plain bytes and True if it was an envelope ciphertext (False if it was an old RSA ciphertext)
+    """
+    prefix_size = len(ENVELOPE_PREFIX)
+    version = encrypted_data[prefix_size:prefix_size + 1]
+    if encrypted_data.startswith(ENVELOPE_PREFIX) and version in (ENVELOPE_V1, ENVELOPE_V2):
+        key_id, start = 1, prefix_size + 1
+        if version == ENVELOPE_V2:
+            key_id = int.from_bytes(encrypted_data[start:start + _KEY_ID_SIZE], "big")
+            start += _KEY_ID_SIZE
+        nonce = encrypted_data[start:start + _NONCE_SIZE]
+        try:
+            return AESGCM(_get_data_key(key_id)).decrypt(nonce, encrypted_data[start + _NONCE_SIZE:], None), True
+        except (InvalidTag, KeyError):
+            # a RSA ciphertext is random bytes, so in theory it can start with our prefix as well.
+            # The tag check failing tells us it was not ours, so we will still give RSA a go
+            if len(encrypted_data) != RSA_BLOCK_SIZE:
+                raise
+    return _rsa_decrypt(encrypted_data), False
+
+
+def is_legacy_ciphertext(encrypted_data: str | bytes) -> bool:
+    """
+    :return: True if the data is still encrypted with the old per-field RSA encryption
+    """
+    return ciphertext_key_id(encrypted_data) is None
+
+
+def needs_reencryption(encrypted_data: str | bytes) -> bool:
+    """
+    :return: True if the data is not encrypted with the active data key
+    """
+    return ciphertext_key_id(encrypted_data) != _active_key_id
+
+
+def encrypt_data(data: str) -> bytes:
+    return _seal(data.encode("utf-8"))
+
+
+def encrypt_data_str(data: str) -> str:
+    return encrypt_data(data).hex()
+
+
+def decrypt_data(encrypted_data: str | bytes) -> str:
+    if isinstance(encrypted_data, str):
+        encrypted_data = bytes.fromhex(encrypted_data)
+    return _open(encrypted_data)[0].decode()
+
+
+def encrypt_record(data: str, size: int = RSA_BLOCK_SIZE) -> bytes:
+    """
+    Same as `encrypt_data`, however, the result is always exactly `size` bytes long.
+    This is used for files that are made out of fixed size records (like the logs)
+    :param data: the data to encrypt, which must fit in the record
+    :param size: the size of the encrypted record in bytes
+    """
+    plain = data.encode("utf-8")
+    room = size - ENVELOPE_OVERHEAD - 2  # 2 bytes are used to store the real length of the data
+    if len(plain) > room:
+        raise ValueError(f"Data is too long to fit in a record of {size} bytes")
+    return _seal(len(plain).to_bytes(2, "big") + plain + bytes(room - len(plain)))
+
+
+def decrypt_record(encrypted_record: bytes) -> str:
+    """
+    decrypts a record made by `encrypt_record`, old RSA encrypted records can also be decrypted by this method
+    """
+    plain, is_envelope = _open(encrypted_record)
+    if is_envelope:
+        length = int.from_bytes(plain[:2], "big")
+        plain = plain[2:2 + length]
+    return plain.decode()
+
+
+_ENTRY_LENGTH = struct.Struct(">I")
+
+
+def encrypt_block(entries: list[str]) -> bytes:
+    """
+    Packs many entries (each with its length in front of it) into one block, which is compressed and then encrypted
+    as a whole. So the entries can have any length, and it is only one encryption for all of them
+    """
+    packed = bytearray()
+    for entry in entries:
+        plain = entry.encode("utf-8")
+        packed += _ENTRY_LENGTH.pack(len(plain)) + plain
+    return _seal(zlib.compress(bytes(packed)))
+
+
+def decrypt_block(encrypted_block: bytes) -> list[str]:
+    """
+    decrypts a block made by `encrypt_block`
+    :return: the entries in the same order they were packed in
+    """
+    packed = zlib.decompress(_open(encrypted_block)[0])
+    entries, offset = [], 0
+    while offset < len(packed):
+        (length,) = _ENTRY_LENGTH.unpack_from(packed, offset)
+        offset += _ENTRY_LENGTH.size
+        entries.append(packed[offset:offset + length].decode("utf-8"))
+        offset += length
+    return entries
+
+
+def reencrypt_block(encrypted_block: bytes) -> bytes:
+    """
+    Encrypts a block made by `encrypt_block` again with the active data key. The compressed data is sealed as is,
+    so the result has the exact same length (compressing it again is not guaranteed to give the same bytes)
+    """
+    return _seal(_open(encrypted_block)[0])
+
+
+# Since the encryption is random, we cant search for encrypted values in the db.
+# A blind index is a keyed hash (HMAC) of the value, the same value always gives the same hash,
+# so we can search on it. Without the key, you can not guess the values by hashing a bunch of guesses.
+# The blind index key has its own place in the keyring, so it doesn't change when the data key is rotated.
+def blind_index(value: str) -> str:
+    return hmac.new(_blind_index_key, value.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+# Decrypting a whole table one value at a time only uses a single core.
+# The cryptography primitives release the GIL, so a pool of threads can run them in parallel.
+# A pool of processes is also possible, which also spreads the python overhead around each value over the cores.
+# (note that we use multiprocessing.pool instead of concurrent.futures,
+# since that one imports the standard `logging` module, which is shadowed by our own logging.py)
+POOL_KIND = "thread"  # "thread" or "process"
+POOL_SIZE = os.cpu_count() or 1
+POOL_MIN_BATCH = 64  # smaller batches are done on the calling thread, since then the pool is just overhead
+
+_pool: Pool | None = None
+
+
+def configure_pool(kind: str = None, size: int = None) -> None:
+    """
+    Changes the kind and/or the size of the worker pool used by `decrypt_many` and `encrypt_many`
+    :param kind: "thread" or "process"
+    :param size: the amount of workers
+    """
+    global POOL_KIND, POOL_SIZE
+    if kind not in (None, "thread", "process"):
+        raise ValueError(f"Unknown pool kind '{kind}'")
+    shutdown_pool()
+    POOL_KIND = kind or POOL_KIND
+    POOL_SIZE = size or POOL_SIZE
+
+
+def _get_pool() -> Pool:
+    global _pool
+    if _pool is None:
+        if POOL_KIND == "process":
+            # every process needs to load the keys for itself
+            _pool = Pool(POOL_SIZE, initializer=initialize_keys)
+        else:
+            _pool = ThreadPool(POOL_SIZE)
+    return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        _pool.join()
+        _pool = None
+
+
+def _map(function, items: list) -> list:
+    if POOL_SIZE <= 1 or len(items) < POOL_MIN_BATCH:
+        return [function(item) for item in items]
+    # a few chunks per worker, so a slow chunk doesn't leave the other workers waiting
+    chunk_size = max(1, len(items) // (POOL_SIZE * 4))
+    return _get_pool().map(function, items, chunk_size)
+
+
+def map_on_pool(function, items: list) -> list:
+    """
+    Calls the function for every item, spread over the worker pool (like `encrypt_many`, but for any function).
+    With a process pool, the function must be a module level function (so it can be sent to the other processes).
+    The order of the results is the same as the input.
+    """
+    return _map(function, list(items))
+
+
+def decrypt_many(encrypted_data: list[str | bytes], is_record: bool = False) -> list[str]:
+    """
+    Decrypts a batch of values, spread over the worker pool. The order of the results is the same as the input.
+    :param encrypted_data: the values to decrypt
+    :param is_record: if the values are made with `encrypt_record` instead of `encrypt_data`
+    """
+    return _map(decrypt_record if is_record else decrypt_data, list(encrypted_data))
+
+
+def decrypt_blocks(encrypted_blocks: list[bytes]) -> list[list[str]]:
+    """
+    Decrypts a batch of blocks made by `encrypt_block`, spread over the worker pool.
+    """
+    return _map(decrypt_block, list(encrypted_blocks))
+
+
+def encrypt_many(data: list[str]) -> list[bytes]:
+    """
+    Encrypts a batch of values with `encrypt_data`, spread over the worker pool.
+    The order of the results is the same as the input.
+    """
+    return _map(encrypt_data, list(data))
+
+
+# A signature (HMAC) proves that data (like the log header) was written by us and not changed afterwards
+def sign(data: bytes) -> str:
+    integrity_key = hmac.new(_blind_index_key, b"integrity", hashlib.sha256).digest()
+    return hmac.new(integrity_key, data, hashlib.sha256).hexdigest()
+
+
+def verify(data: bytes, signature: str) -> bool:
+    return hmac.compare_digest(sign(data), signature)
 
 
 def hash_password(password: str) -> str:
@@ -0,0 +1,65 @@
+import csv
+import json
+import time
+from pipeline import run_pipeline
+from encryption import decrypt_many, decrypt_blocks
+from logging import Logger, LogEntry, FOOTER_PREFIX, HIDDEN_LOG
+
+if __name__ == "__main__":
+    raise SystemExit("This file is not meant to be run directly. Please run the main script called um_members.py")
+
+# The export is a pipeline of 3 stages that all run at the same time (see pipeline.py):
+#   read -> decrypt (which spreads every chunk over the worker pool) -> serialize and write
+EXPORT_FORMATS = ("csv", "jsonl")
+EXPORT_FIELDS = ("id", "date", "time", "username", "description", "additional_info", "suspicious")
+CHUNK_SIZE = 1_000
+
+
+def _decrypt_chunk(chunk: tuple[bool, list[bytes]]) -> list[LogEntry]:
+    is_blocks, encrypted = chunk
+    if is_blocks:
+        contents = [entry for entries in decrypt_blocks(encrypted) for entry in entries]
+    else:
+        contents = decrypt_many(encrypted, is_record=True)
+    logs = [LogEntry.from_string(content) for content in contents if not content.startswith(FOOTER_PREFIX)]
+    return [log for log in logs if log.description != HIDDEN_LOG]
+
+
+def export_logs(logger: Logger, file_path: str, export_format: str = "csv", start_date: str = None,
+                end_date: str = None, suspicious: bool = None, include_archive: bool = False) -> dict:
+    """
+    Writes the decrypted logs to a file, without ever loading all of them in memory
+    :param file_path: the file to write to (it is overwritten)
+    :param export_format: "csv" or "jsonl" (one json object per line)
+    :param start_date: only the logs from this date (YYYY-MM-DD), inclusive
+    :param end_date: only the logs until this date (YYYY-MM-DD), inclusive
+    :param suspicious: only the suspicious (True) or the not suspicious (False) logs
+    :param include_archive: if the archived logs should be exported as well
+    :return: the amount of exported logs, the seconds it took and the exported logs per second
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {export_format}")
+
+    def matches(log: LogEntry) -> bool:
+        return ((start_date is None or log.date >= start_date) and (end_date is None or log.date <= end_date)
+                and (suspicious is None or log.suspicious == str(suspicious)))
+
+    started = time.perf_counter()
+    chunks = logger.iter_encrypted_chunks(start_date, end_date, suspicious, include_archive, CHUNK_SIZE)
+
+    exported = 0
+    with open(file_path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        if export_format == "csv":
+            writer.writerow(EXPORT_FIELDS)
+        for logs in run_pipeline(chunks, _decrypt_chunk):
+            rows = [[getattr(log, field) for field in EXPORT_FIELDS] for log in logs if matches(log)]
+            if export_format == "csv":
+                writer.writerows(rows)
+            else:
+                file.writelines(json.dumps(dict(zip(EXPORT_FIELDS, row))) + "\n" for row in rows)
+            exported += len(rows)
+
+    seconds = time.perf_counter() - started
+    return {"exported": exported, "seconds": round(seconds, 3),
+            "logs_per_second": round(exported / seconds) if seconds else exported}
@@ -0,0 +1,151 @@
+import os
+import json
+import struct
+import tempfile
+from os import path
+from encryption import encrypt_data, decrypt_data, needs_reencryption
+
+if __name__ == "__main__":
+    raise SystemExit("This file is not meant to be run directly. Please run the main script called um_members.py")
+
+# Every log segment gets an index file next to it (segment_<first id>.idx), also for the active segment.
+# The index maps a key (like the username or the hour a log was made) to the positions of the records in the segment
+# that have it, so a query only has to decrypt the records that match.
+# The file is a list of frames, every frame is a length followed by an encrypted json object of one batch of logs.
+# New logs only add a frame, and when the segment is sealed all frames are merged into one.
+_LENGTH = struct.Struct(">I")
+
+
+def replace_file(file_path: str, content: bytes) -> None:
+    """
+    Writes the content to a temporary file next to it and then swaps that in, so a crash never leaves half a file.
+    Every write gets its own temporary file, so two processes that replace the same file don't trip over each other
+    """
+    descriptor, temp_path = tempfile.mkstemp(prefix=path.basename(file_path) + ".", suffix=".tmp",
+                                             dir=path.dirname(file_path) or ".")
+    try:
+        with os.fdopen(descriptor, "wb") as file:
+            file.write(content)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def index_keys(log) -> list[str]:
+    """
+    :param log: a LogEntry
+    :return: all the keys this log can be found with
+    """
+    return [f"user:{log.username.lower()}",
+            f"description:{log.description.lower()}",
+            f"suspicious:{log.suspicious}",
+            f"hour:{log.date} {log.time[:2]}"]
+
+
+def build_postings(logs: list, start: int) -> dict[str, list[int]]:
+    """
+    :param logs: LogEntries that are saved right after each other
+    :param start: the position (record index) of the first log in the segment
+    """
+    postings: dict[str, list[int]] = {}
+    for position, log in enumerate(logs, start):
+        for key in index_keys(log):
+            postings.setdefault(key, []).append(position)
+    return postings
+
+
+def _frame(postings: dict[str, list[int]], start: int, end: int) -> bytes:
+    data = encrypt_data(json.dumps({"start": start, "end": end, "postings": postings}))
+    return _LENGTH.pack(len(data)) + data
+
+
+def load_index(index_path: str) -> tuple[dict[str, set[int]], int, int]:
+    """
+    :return: the postings, the amount of records (from the start) that are indexed,
+        and the length of the valid part of the file (an incomplete frame at the end is from a crash)
+    """
+    postings: dict[str, set[int]] = {}
+    ranges = []
+    valid_length = 0
+    if not path.exists(index_path):
+        return postings, 0, valid_length
+
+    with open(index_path, "rb") as file:
+        content = file.read()
+    while valid_length + _LENGTH.size <= len(content):
+        (length,) = _LENGTH.unpack_from(content, valid_length)
+        end = valid_length + _LENGTH.size + length
+        if end > len(content):
+            break
+        try:
+            frame = json.loads(decrypt_data(content[valid_length + _LENGTH.size:end]))
+        except Exception:
+            break
+        for key, positions in frame["postings"].items():
+            postings.setdefault(key, set()).update(positions)
+        ranges.append((frame["start"], frame["end"]))
+        valid_length = end
+
+    # if a batch got lost in a crash there is a gap, everything after that gap has to be indexed again
+    covered = 0
+    for start, end in sorted(ranges):
+        if start > covered:
+            break
+        covered = max(covered, end)
+    return postings, covered, valid_length
+
+
+def append_to_index(index_path: str, logs: list, start: int) -> None:
+    """
+    Adds the logs to the index, this should be called with every batch of logs that is appended to the segment
+    :param start: the position (record index) of the first log in the segment
+    """
+    if not logs:
+        return
+    with open(index_path, "ab") as file:
+        file.write(_frame(build_postings(logs, start), start, start + len(logs)))
+
+
+def catch_up_index(index_path: str, logs: list, start: int, valid_length: int) -> None:
+    """
+    Indexes the records that were saved without being indexed (like after a crash)
+    :param logs: the LogEntries of these records
+    :param start: the position of the first of these records
+    :param valid_length: the length of the valid part of the index, anything after it is thrown away
+    """
+    with open(index_path, "ab") as file:
+        file.truncate(valid_length)
+        file.write(_frame(build_postings(logs, start), start, start + len(logs)))
+
+
+def compact_index(index_path: str) -> None:
+    """
+    Merges all the frames into one, this is done when a segment is sealed since it never changes after that
+    """
+    if not path.exists(index_path):
+        return
+    postings, covered, _ = load_index(index_path)
+    postings = {key: sorted(positions) for key, positions in postings.items()}
+    replace_file(index_path, _frame(postings, 0, covered))
+
+
+def reencrypt_index(index_path: str) -> bool:
+    """
+    Rewrites the index with the active data key if any of its frames is encrypted with an older one (after a key
+    rotation), the frames are merged into one while at it
+    :return: if the index had to be rewritten
+    """
+    if not path.exists(index_path):
+        return False
+    with open(index_path, "rb") as file:
+        content = file.read()
+    offset = 0
+    while offset + _LENGTH.size <= len(content):
+        (length,) = _LENGTH.unpack_from(content, offset)
+        if needs_reencryption(content[offset + _LENGTH.size:offset + _LENGTH.size + length]):
+            compact_index(index_path)
+            return True
+        offset += _LENGTH.size + length
+    return False
@@ -1,11 +1,59 @@
+import os
+import json
+import mmap
+import struct
+import atexit
+import weakref
+import threading
 from os import path
-from datetime import datetime
-from encryption import decrypt_data, encrypt_data
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from encryption import (decrypt_record, encrypt_record, is_legacy_ciphertext, needs_reencryption, decrypt_many,
+                        encrypt_block, decrypt_block, decrypt_blocks, reencrypt_block, sign, verify, RSA_BLOCK_SIZE)
+from log_index import (replace_file, load_index, append_to_index, catch_up_index, compact_index, build_postings,
+                       reencrypt_index)
+from cache import LRUCache
 
 if __name__ == "__main__":
     raise SystemExit("This file is not meant to be run directly. Please run the main script called um_members.py")
 
-HIDDEN_LOG = "_hidden"
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+HIDDEN_LOG = "_hidden"  # older log files flagged the viewed logs with a hidden log, these are skipped
+SEGMENT_MAX_RECORDS = 10_000  # the active segment is sealed when it gets this big, or when a new day starts
+FOOTER_PREFIX = "_footer;"  # the last record of a sealed segment, a log always starts with its id so they never mix
+
+# Older log files are made of fixed size records, every log encrypted on its own in 256 bytes.
+# That limited how long a log could be, and cost a whole encryption for every log.
+# Now every batch of logs is written as one block: the logs (each with its length in front) are compressed
+# and then encrypted together. Each block is framed by a header (length, position of its first log, amount of logs)
+# and a trailer (the length again), so the file can be walked from the start and from the end without decrypting.
+# A block file starts with BLOCK_MAGIC, the old files start with a ciphertext, so both can still be read.
+RECORD_SIZE = RSA_BLOCK_SIZE
+BLOCK_MAGIC = b"UMLOGB\x01\n"
+_FRAME_HEADER = struct.Struct(">III")
+_FRAME_TRAILER = struct.Struct(">I")
+FOOTER_BLOCK = 0xFFFFFFFF  # the position of the footer block, since that one holds the summary instead of logs
+
+# The logs are not written the moment they are logged, but queued and written in batches by a background thread.
+# A batch is written when FLUSH_COUNT logs are waiting, after FLUSH_INTERVAL seconds, or when the logs are read.
+# With the "fsync" durability every batch is forced to the disk before it counts as written,
+# with "interval" it is only handed to the OS (faster, but a power loss can cost the last batches)
+DURABILITY_FSYNC = "fsync"
+DURABILITY_INTERVAL = "interval"
+DURABILITY = DURABILITY_FSYNC
+FLUSH_INTERVAL = 0.5
+FLUSH_COUNT = 256
+INDEX_CACHE_SIZE = 32  # the indexes of sealed segments never change, so the most recently queried ones are kept
+
+# Sealed segments older than this are moved into an archive by `Logger.archive` (see migrate.py).
+# An archive is one file for all the segments of that run, with much bigger blocks so it compresses better.
+# The archives are not read by the normal log functions, only by a query that asks for them
+ARCHIVE_AFTER_DAYS = 90
+ARCHIVE_BLOCK_SIZE = 1_000
 
 
 class LogEntry:
@@ -28,81 +76,1153 @@ class LogEntry:
         return cls(*string.split(";"))
 
 
+def _new_summary() -> dict:
+    # what a segment footer holds, the count and suspicious count don't include the hidden logs (the records do).
+    # The records are only filled in when the segment is sealed, and older footers don't have them at all
+    return {"first_id": None, "last_id": None, "first_date": None, "last_date": None, "count": 0, "suspicious": 0,
+            "records": 0}
+
+
+def _visible(logs: list[LogEntry]) -> list[LogEntry]:
+    return [log for log in logs if log.description != HIDDEN_LOG]
+
+
+def _write_signed(file_path: str, fields: dict) -> None:
+    fields = json.dumps(fields, sort_keys=True)
+    replace_file(file_path, json.dumps({"fields": fields, "signature": sign(fields.encode())}).encode())
+
+
+def _read_signed(file_path: str) -> dict:
+    with open(file_path, "r") as file:
+        content = json.load(file)
+    if not verify(content["fields"].encode(), content["signature"]):
+        raise ValueError(f"The signature of {file_path} is invalid")
+    return json.loads(content["fields"])
+
+
+def _lock_file(file) -> None:
+    # waits until no other process holds the lock on this file
+    if os.name == 'nt':
+        file.seek(0)
+        while True:
+            try:
+                msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                continue  # LK_LOCK gives up after 10 seconds, but the other process is still busy so we keep on waiting
+    fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+
+
+def _unlock_file(file) -> None:
+    if os.name == 'nt':
+        file.seek(0)
+        msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+
+def _is_block_file(file_path: str) -> bool:
+    if not path.exists(file_path):
+        return False
+    with open(file_path, "rb") as file:
+        return file.read(len(BLOCK_MAGIC)) == BLOCK_MAGIC
+
+
+def _frames(view, reverse: bool = False, start: int = 0):
+    """
+    Walks over the complete frames of a block file, an incomplete frame at the end (from a crash) is left out
+    :param view: the content of the file (a memory map)
+    :param start: the offset of the first frame to walk over (only when not in reverse)
+    :return: a generator of (offset of the frame, position of its first log, amount of logs, end of the frame)
+    """
+    if not reverse:
+        offset = max(start, len(BLOCK_MAGIC))
+        while offset + _FRAME_HEADER.size <= len(view):
+            length, position, count = _FRAME_HEADER.unpack_from(view, offset)
+            end = offset + _FRAME_HEADER.size + length + _FRAME_TRAILER.size
+            if end > len(view):
+                return
+            yield offset, position, count, end
+            offset = end
+        return
+
+    end = len(view)
+    while end > len(BLOCK_MAGIC):
+        (length,) = _FRAME_TRAILER.unpack_from(view, end - _FRAME_TRAILER.size)
+        offset = end - _FRAME_TRAILER.size - length - _FRAME_HEADER.size
+        if offset < len(BLOCK_MAGIC) or _FRAME_HEADER.unpack_from(view, offset)[0] != length:
+            # the end isn't a complete frame, so the frames are found from the start instead
+            yield from reversed([frame for frame in _frames(view) if frame[3] <= end])
+            return
+        yield (offset, *_FRAME_HEADER.unpack_from(view, offset)[1:], end)
+        end = offset
+
+
+def _frame_payload(view, frame: tuple) -> bytes:
+    offset, _, _, end = frame
+    return view[offset + _FRAME_HEADER.size:end - _FRAME_TRAILER.size]
+
+
+def _pack_frame(position: int, count: int, encrypted_block: bytes) -> bytes:
+    return (_FRAME_HEADER.pack(len(encrypted_block), position, count) + encrypted_block
+            + _FRAME_TRAILER.pack(len(encrypted_block)))
+
+
+# the loggers that are not closed yet, these are closed when python exits so the last batch isn't lost when someone
+# forgets to close the database. It is a weak set, so it doesn't keep a logger alive that is no longer used
+_open_loggers: weakref.WeakSet = weakref.WeakSet()
+
+
+def _close_open_loggers() -> None:
+    for logger in list(_open_loggers):
+        logger.close()
+
+
+atexit.register(_close_open_loggers)
+
+
 class Logger:
     """
     This class is responsible for logging all the actions that are happening in the system.
     It logs the date, time, username, description, additional info and if the action was suspicious or not.
-    It also keeps track of the login attempts and password change attempts.
+
+    New logs are appended to the active segment (the log file itself). When that gets too big, or a new day starts,
+    it is sealed with an encrypted footer (id range, date range, count and suspicious count) and moved to the
+    segments folder. The summaries of the sealed segments are kept in a signed index in that folder,
+    so the queries below can skip whole segments without decrypting them.
     """
 
-    def __init__(self, path):
+    def __init__(self, path, durability: str = None, flush_interval: float = None, flush_count: int = None):
+        if (durability or DURABILITY) not in (DURABILITY_FSYNC, DURABILITY_INTERVAL):
+            raise ValueError(f"Unknown durability: {durability}")
         self.path = path
-        self.login_attempts = 0
-        self.change_attempts = 0
-        logs = self.get_all_logs()
-        self.current_index = len(logs)
+        self.durability = durability or DURABILITY
+        self.flush_interval = flush_interval or FLUSH_INTERVAL
+        self.flush_count = flush_count or FLUSH_COUNT
+        # the header is a small signed file next to the logs that remembers how many records there are, the last id,
+        # and up to which id the logs have been viewed (and how many risks came in after that).
+        # So we don't have to decrypt the whole log file just to know where we are
+        self.header_path = os.path.splitext(path)[0] + ".header"
+        self.segments_path = os.path.splitext(path)[0] + "_segments"
+        self.segments_index_path = os.path.join(self.segments_path, "segments.index")
+        self.archive_path = os.path.splitext(path)[0] + "_archive"
+        # other processes (like seeds.py, or a second terminal) write to the same log files,
+        # so everything that writes to them holds the lock on this file (see `_locked`)
+        self.lock_path = os.path.splitext(path)[0] + ".lock"
+        self.current_index = 0
+        self.record_count = 0
+        self.active_size = 0  # the size of the active segment (in bytes) after the last write we know of
+        self.viewed_id = 0
+        self.unread_risks = 0
+        self.active = _new_summary()
+        self.segments: list[dict] = []
+        self.archives: list[dict] = []
+        # the segments index gets a new version every time a segment is sealed or archived,
+        # so other processes know they have to load it again
+        self.segments_version = 0
+        self._index_cache = LRUCache(INDEX_CACHE_SIZE)
+        # the lock guards the header fields, the queue lock only the queue (so logging never waits for a write),
+        # the write lock makes sure the batches are written in order
+        self._lock = threading.RLock()
+        self._queue_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._file_lock = threading.RLock()
+        self._file_lock_depth = 0
+        self._lock_file = None
+        self._queue: list[LogEntry] = []
+        self._wake_up = threading.Event()
+        self._writer: threading.Thread | None = None
+        self._error: Exception | None = None  # why the background writer failed, until a batch is written again
+        self._closed = False
+        with self._locked():
+            self._load_header()
+        _open_loggers.add(self)
+
+    @contextmanager
+    def _locked(self):
+        """
+        Holds the lock on the log files until the block ends, for the other processes and the other threads.
+        It can be nested, and always has to be taken before the lock of the header fields
+        """
+        with self._file_lock:
+            if self._file_lock_depth == 0:
+                self._lock_file = open(self.lock_path, "a+b")
+                _lock_file(self._lock_file)
+            self._file_lock_depth += 1
+            try:
+                yield
+            finally:
+                self._file_lock_depth -= 1
+                if self._file_lock_depth == 0:
+                    _unlock_file(self._lock_file)
+                    self._lock_file.close()
+                    self._lock_file = None
+
+    # =================== #
+    #       HEADER        #
+    # =================== #
+
+    def _header_fields(self) -> dict:
+        return {"record_count": self.record_count, "active_size": self.active_size, "last_id": self.current_index,
+                "viewed_id": self.viewed_id, "unread_risks": self.unread_risks,
+                "active": self.active, "segments_version": self.segments_version}
+
+    def _save_header(self) -> None:
+        _write_signed(self.header_path, self._header_fields())
+
+    def _load_header(self) -> None:
+        """
+        Loads the header, if it is missing or changed by someone else (the signature doesn't match),
+        then it is rebuilt from the log files themselves. If another process added logs after it, only those are read.
+        """
+        try:
+            fields = _read_signed(self.header_path)
+            self.record_count = fields["record_count"]
+            self.active_size = fields["active_size"]
+            self.current_index = fields["last_id"]
+            self.viewed_id = fields["viewed_id"]
+            self.unread_risks = fields["unread_risks"]
+            self.active = fields["active"]
+            segments_version = fields["segments_version"]
+        except (FileNotFoundError, ValueError, KeyError):
+            self._rebuild_header()
+            return
+
+        if self.segments_version != segments_version:
+            self._load_segments()  # another process sealed (or archived) a segment in the meantime
+            if self.segments_version != segments_version:
+                self._rebuild_header()
+                return
+
+        # the size tells us if the log file changed, without having to open it
+        size_on_disk = path.getsize(self.path) if path.exists(self.path) else 0
+        if self.active_size > size_on_disk:
+            self._rebuild_header()  # the log file has been replaced (like a restored backup)
+        elif self.active_size < size_on_disk:
+            logs, footer = self._read_segment(self.path, self.record_count)
+            self._apply_to_header(logs)
+            self.active_size = size_on_disk
+            if footer is not None:
+                self._move_active_segment()  # the sealing got interrupted after the footer was written
+            else:
+                self._save_header()
+
+    def _rebuild_header(self) -> None:
+        # this only reads the footers of the sealed segments and the active segment itself,
+        # and only happens if the header is lost or tampered with
+        self.archives, self.segments = self._scan_segments()
+        self._save_segments()
+        self.record_count = self.viewed_id = self.unread_risks = 0
+        self.current_index = max([segment["last_id"] or 0 for segment in self.archives + self.segments], default=0)
+        # we don't know which of the sealed risks have been viewed anymore, so to be safe they all count as unread
+        self.unread_risks = sum(segment["suspicious"] for segment in self.segments)
+        self.active = _new_summary()
+        logs, footer = self._read_segment(self.path)
+        self._apply_to_header(logs)
+        self.active_size = path.getsize(self.path) if path.exists(self.path) else 0
+        if footer is not None:
+            self._move_active_segment()
+        else:
+            self._save_header()
+
+    def _apply_to_header(self, logs: list[LogEntry]) -> None:
+        for log in logs:
+            self.record_count += 1
+            self.current_index = log.id
+            if self.active["first_id"] is None:
+                self.active["first_id"] = log.id
+                self.active["first_date"] = log.date
+            self.active["last_id"] = log.id
+            self.active["last_date"] = log.date
+            if log.description == HIDDEN_LOG:
+                # this is how the viewed logs were flagged before the header existed
+                self.viewed_id = log.id
+                self.unread_risks = 0
+                continue
+            self.active["count"] += 1
+            if str(log.suspicious) == "True":
+                self.unread_risks += 1
+                self.active["suspicious"] += 1
+
+    # =================== #
+    #      SEGMENTS       #
+    # =================== #
+
+    def _load_segments(self) -> None:
+        try:
+            fields = _read_signed(self.segments_index_path)
+            self.segments = fields["segments"]
+            self.archives = fields["archives"]
+            self.segments_version = fields["version"]
+        except (FileNotFoundError, ValueError, KeyError):
+            self.archives, self.segments = self._scan_segments()
+            self._save_segments()
+
+    def _save_segments(self) -> None:
+        if not (self.segments or self.archives or path.exists(self.segments_index_path)):
+            return
+        self.segments_version += 1
+        os.makedirs(self.segments_path, exist_ok=True)
+        _write_signed(self.segments_index_path, {"segments": self.segments, "archives": self.archives,
+                                                 "version": self.segments_version})
+
+    def _scan_segments(self) -> tuple[list[dict], list[dict]]:
+        """
+        Reads the summaries of the archives and the sealed segments from their footers, only if a footer is missing
+        or broken the whole file is read.
+        :return: the archives and the segments
+        """
+        archives = self._scan_folder(self.archive_path, "archive_")
+        archived_id = max([archive["last_id"] or 0 for archive in archives], default=0)
+        # if the archiving got interrupted, the segments that are already in an archive are still there as well
+        segments = [segment for segment in self._scan_folder(self.segments_path, "segment_")
+                    if (segment["last_id"] or 0) > archived_id]
+        return archives, segments
+
+    def _scan_folder(self, folder: str, prefix: str) -> list[dict]:
+        if not path.exists(folder):
+            return []
+
+        segments = []
+        for name in sorted(os.listdir(folder)):
+            if not (name.startswith(prefix) and name.endswith(".bin")):
+                continue
+            segment_path = path.join(folder, name)
+            summary = self._read_footer(segment_path)
+            if summary is None:
+                summary = _new_summary()
+                for log in self._read_segment(segment_path)[0]:
+                    summary["records"] += 1
+                    if summary["first_id"] is None:
+                        summary["first_id"], summary["first_date"] = log.id, log.date
+                    summary["last_id"], summary["last_date"] = log.id, log.date
+                    if log.description != HIDDEN_LOG:
+                        summary["count"] += 1
+                        summary["suspicious"] += str(log.suspicious) == "True"
+            segments.append({"name": name, **summary})
+        return segments
+
+    @staticmethod
+    def _read_footer(segment_path: str) -> dict | None:
+        try:
+            if _is_block_file(segment_path):
+                with open(segment_path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                    frame = next(_frames(view, reverse=True), None)
+                    if frame is None or frame[1] != FOOTER_BLOCK:
+                        return None
+                    content = decrypt_block(_frame_payload(view, frame))[0]
+            else:
+                size = path.getsize(segment_path)
+                if size < RECORD_SIZE:
+                    return None
+                with open(segment_path, "rb") as file:
+                    file.seek((size // RECORD_SIZE - 1) * RECORD_SIZE)
+                    content = decrypt_record(file.read(RECORD_SIZE))
+        except Exception:
+            return None
+        if not content.startswith(FOOTER_PREFIX):
+            return None
+        return json.loads(content[len(FOOTER_PREFIX):])
+
+    def _should_seal(self, date: str) -> bool:
+        if self.record_count == 0:
+            return False
+        return self.record_count >= SEGMENT_MAX_RECORDS or self.active["first_date"] != date
+
+    def _cut_incomplete_tail(self) -> None:
+        """
+        Cuts an incomplete frame (or record, in an older log file) that a crash left at the end of the active segment
+        """
+        # an incomplete frame at the end would make everything written after it unreadable
+        with self._locked():
+            if not path.exists(self.path) or path.getsize(self.path) == 0:
+                return
+            with open(self.path, "r+b") as file:
+                size = path.getsize(self.path)
+                if _is_block_file(self.path):
+                    with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                        last_frame = next(_frames(view, reverse=True), None)
+                    end = last_frame[3] if last_frame else len(BLOCK_MAGIC)
+                else:
+                    end = size - size % RECORD_SIZE
+                if end < size:
+                    file.truncate(end)
+
+    def _seal_active_segment(self) -> None:
+        # the footer goes right after the last complete frame, or it could not be found again
+        self._cut_incomplete_tail()
+        self.active["records"] = self.record_count
+        footer = FOOTER_PREFIX + json.dumps(self.active, sort_keys=True)
+        with open(self.path, "ab") as file:
+            if _is_block_file(self.path):
+                file.write(_pack_frame(FOOTER_BLOCK, 0, encrypt_block([footer])))
+            else:
+                file.write(encrypt_record(footer, RECORD_SIZE))
+            file.flush()
+            os.fsync(file.fileno())
+        self._move_active_segment()
+
+    def _move_active_segment(self) -> None:
+        # named after the first id, so they are sorted in the order they were written
+        name = f"segment_{self.active['first_id'] or 0:010}.bin"
+        os.makedirs(self.segments_path, exist_ok=True)
+        os.replace(self.path, path.join(self.segments_path, name))
+        # the index of a sealed segment never changes anymore, so its frames are merged into one
+        self._load_segment_index(path.join(self.segments_path, name))
+        compact_index(self._index_path(path.join(self.segments_path, name)))
+        self.active["records"] = self.record_count  # the sealing could have been interrupted before the footer
+        self.segments.append({"name": name, **self.active})
+        self._save_segments()
+        self.active = _new_summary()
+        self.record_count = 0
+        self.active_size = 0
+        self._save_header()
+
+    def _all_segments(self, include_archive: bool = False) -> list[tuple[str, dict]]:
+        """
+        :param include_archive: if the archives should be included as well (they come first)
+        :return: the path and summary of every segment from old to new, the active segment is the last one
+        """
+        archives = [(path.join(self.archive_path, archive["name"]), archive) for archive in self.archives]
+        return ((archives if include_archive else [])
+                + [(path.join(self.segments_path, segment["name"]), segment) for segment in self.segments]
+                + [(self.path, self.active)])
+
+    def get_files(self, include_archive: bool = False) -> list[str]:
+        """
+        :param include_archive: if the archives (and their indexes) should be included as well
+        :return: every file that belongs to the logs, like for a backup
+        """
+        self._sync()
+        files = [self.header_path, self.segments_index_path]
+        for segment_path, _ in self._all_segments(include_archive):
+            files += [segment_path, self._index_path(segment_path)]
+        return [file for file in files if path.exists(file)]
+
+    # =================== #
+    #       ARCHIVE       #
+    # =================== #
+
+    def archive(self, older_than_days: int = None) -> int:
+        """
+        Moves the sealed segments with only logs older than this into a new archive file.
+        The archive is written (and indexed) first, and only then the segments are removed,
+        so a crash halfway never loses logs.
+        :param older_than_days: the age (in days) of the logs to archive, ARCHIVE_AFTER_DAYS by default
+        :return: the amount of logs that have been archived
+        """
+        if older_than_days is None:
+            older_than_days = ARCHIVE_AFTER_DAYS
+        cutoff = str((datetime.now() - timedelta(days=older_than_days)).date())
+        self._sync()
+        with self._locked(), self._lock:
+            old_segments = []
+            for segment in self.segments:  # the segments are in order, so the old ones are all at the start
+                if segment["last_date"] is None or segment["last_date"] >= cutoff:
+                    break
+                old_segments.append(segment)
+            if not old_segments:
+                return 0
+
+            name = f"archive_{old_segments[0]['first_id'] or 0:010}.bin"
+            archive_path = path.join(self.archive_path, name)
+            index_path = self._index_path(archive_path)
+            os.makedirs(self.archive_path, exist_ok=True)
+            if path.exists(index_path):
+                os.remove(index_path)  # from an earlier try that crashed, the blocks are appended to it again
+            records = 0
+            with open(archive_path + ".tmp", "wb") as file:
+                file.write(BLOCK_MAGIC)
+                pending = []
+                for segment in old_segments:
+                    # one segment at a time, so the memory that is used doesn't grow with the amount of archived logs
+                    pending += self._read_segment(path.join(self.segments_path, segment["name"]))[0]
+                    full = len(pending) - len(pending) % ARCHIVE_BLOCK_SIZE
+                    for start in range(0, full, ARCHIVE_BLOCK_SIZE):
+                        self._write_archive_block(file, index_path, pending[start:start + ARCHIVE_BLOCK_SIZE], records)
+                        records += ARCHIVE_BLOCK_SIZE
+                    pending = pending[full:]
+                if pending:
+                    self._write_archive_block(file, index_path, pending, records)
+                    records += len(pending)
+                summary = {"first_id": old_segments[0]["first_id"], "last_id": old_segments[-1]["last_id"],
+                           "first_date": old_segments[0]["first_date"], "last_date": old_segments[-1]["last_date"],
+                           "count": sum(segment["count"] for segment in old_segments),
+                           "suspicious": sum(segment["suspicious"] for segment in old_segments), "records": records}
+                file.write(_pack_frame(FOOTER_BLOCK, 0,
+                                       encrypt_block([FOOTER_PREFIX + json.dumps(summary, sort_keys=True)])))
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(archive_path + ".tmp", archive_path)
+            compact_index(index_path)
+
+            self.archives.append({"name": name, **summary})
+            self.segments = self.segments[len(old_segments):]
+            self._save_segments()
+            self._save_header()
+            for segment in old_segments:
+                segment_path = path.join(self.segments_path, segment["name"])
+                self._index_cache.invalidate(segment_path)
+                for file in (segment_path, self._index_path(segment_path)):
+                    if path.exists(file):
+                        os.remove(file)
+        return summary["count"]
+
+    @staticmethod
+    def _write_archive_block(file, index_path: str, logs: list[LogEntry], start: int) -> None:
+        """
+        Writes the logs as the next block of an archive that is being made, and adds them to its index
+        :param start: the position (record index) of the first log in the archive
+        """
+        file.write(_pack_frame(start, len(logs), encrypt_block([log.to_string() for log in logs])))
+        append_to_index(index_path, logs, start)
+
+    # =================== #
+    #       INDEXES       #
+    # =================== #
+
+    def _index_path(self, segment_path: str) -> str:
+        # the index of the active segment is already named after the segment it will be sealed as
+        if segment_path == self.path:
+            segment_path = path.join(self.segments_path, f"segment_{self.active['first_id'] or 0:010}.bin")
+        return os.path.splitext(segment_path)[0] + ".idx"
+
+    def _load_segment_index(self, segment_path: str) -> dict[str, set[int]]:
+        """
+        Loads the index of a segment, the records that aren't indexed yet (like after a crash, or from older log files)
+        are indexed first
+        """
+        index_path = self._index_path(segment_path)
+        postings, covered, valid_length = load_index(index_path)
+        if covered < self._records_in(segment_path):
+            logs = self._read_segment(segment_path, covered)[0]
+            os.makedirs(path.dirname(index_path) or ".", exist_ok=True)
+            catch_up_index(index_path, logs, covered, valid_length)
+            for key, positions in build_postings(logs, covered).items():
+                postings.setdefault(key, set()).update(positions)
+        return postings
+
+    def _get_segment_index(self, segment_path: str) -> dict[str, set[int]]:
+        if segment_path == self.path:
+            return self._load_segment_index(segment_path)
+        postings = self._index_cache.get(segment_path)
+        if postings is None:
+            postings = self._load_segment_index(segment_path)
+            self._index_cache.put(segment_path, postings)
+        return postings
+
+    # =================== #
+    #   READING/WRITING   #
+    # =================== #
+
+    @staticmethod
+    def _read_segment(segment_path: str, start: int = 0) -> tuple[list[LogEntry], dict | None]:
+        """
+        :param start: the index of the first record to read (not the id)
+        :return: the logs, and the footer if the segment has been sealed
+        """
+        if not path.exists(segment_path):
+            return [], None
+
+        if _is_block_file(segment_path):
+            with open(segment_path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                # the blocks before the start are skipped without decrypting them
+                frames = [frame for frame in _frames(view) if frame[1] == FOOTER_BLOCK or frame[1] + frame[2] > start]
+                blocks = decrypt_blocks([_frame_payload(view, frame) for frame in frames])
+            contents = []
+            for (_, position, _, _), entries in zip(frames, blocks):
+                contents += entries if position == FOOTER_BLOCK else entries[max(start - position, 0):]
+        else:
+            encrypted_records = []
+            with open(segment_path, "rb") as file:
+                file.seek(start * RECORD_SIZE)
+                while True:
+                    # we read the data in chunks of 256 bytes because every encrypted record is 256 bytes long
+                    encrypted_content = file.read(RECORD_SIZE)
+                    if len(encrypted_content) < RECORD_SIZE:
+                        break
+                    encrypted_records.append(encrypted_content)
+            contents = decrypt_many(encrypted_records, is_record=True)
+
+        logs, footer = [], None
+        for content in contents:
+            if content.startswith(FOOTER_PREFIX):
+                footer = json.loads(content[len(FOOTER_PREFIX):])
+            else:
+                logs.append(LogEntry.from_string(content))
+        return logs, footer
 
     def _get_logs(self) -> list[LogEntry]:
         logs = []
+        for segment_path, _ in self._all_segments():
+            logs += self._read_segment(segment_path)[0]
+        return logs
+
+    def _save_logs(self, logs: list[LogEntry]) -> None:
+        """
+        Appends a batch of logs with a single write (sealing the active segment in between if needed),
+        and saves the header once for the whole batch.
+        The ids are given out here and not when logging, while the log files are locked, so every process continues
+        after the last id that is really written and two processes never give out the same id.
+        :param logs: the logs to write, the ones that have been written are removed (all of them, unless this fails)
+        """
+        with self._locked(), self._lock:
+            self._load_header()
+            try:
+                if self.record_count and not _is_block_file(self.path):
+                    self._seal_active_segment()  # an older log file with fixed size records, the new logs go in blocks
+                batch = []
+                for log in logs:
+                    if self._should_seal(log.date):
+                        self._append(batch)
+                        batch = []
+                        self._seal_active_segment()
+                    log.id = self.current_index + 1
+                    batch.append(log)
+                    self._apply_to_header([log])
+                self._append(batch)
+                self._save_header()
+                logs.clear()
+            except BaseException:
+                # the files on the disk tell how far we got, the logs up to there don't have to be written again
+                self._load_header()
+                del logs[:sum(0 < log.id <= self.current_index for log in logs)]
+                raise
+
+    def _append(self, logs: list[LogEntry]) -> None:
+        """
+        Appends the logs as one block to the active segment
+        """
+        if not logs:
+            return
+        frame = _pack_frame(self.record_count - len(logs), len(logs), encrypt_block([log.to_string() for log in logs]))
+        # without the lock, the end of the file could be a frame another process is still writing and not a crash
+        with self._locked():
+            self._cut_incomplete_tail()
+            with open(self.path, "ab") as file:
+                if file.tell() == 0:
+                    file.write(BLOCK_MAGIC)
+                file.write(frame)
+                if self.durability == DURABILITY_FSYNC:
+                    file.flush()
+                    os.fsync(file.fileno())
+                self.active_size = file.tell()
+            # the index is updated right after, if that gets lost the next query indexes these records again
+            os.makedirs(self.segments_path, exist_ok=True)
+            append_to_index(self._index_path(self.path), logs, self.record_count - len(logs))
+
+    # =================== #
+    #    BATCH WRITER     #
+    # =================== #
+
+    def _start_writer(self) -> None:
+        if self._writer is None or not self._writer.is_alive():
+            self._writer = threading.Thread(target=self._run_writer, name="log-writer", daemon=True)
+            self._writer.start()
+
+    def _run_writer(self) -> None:
+        while not self._closed:
+            self._wake_up.wait(self.flush_interval)
+            self._wake_up.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                # the logs are back in the queue, so they are tried again next time. Until then `log` writes right away,
+                # so the error reaches whoever is logging instead of getting lost in this thread
+                self._error = e
 
-        if not path.exists(self.path):
-            return logs
+    def _sync(self) -> None:
+        # writes the queued logs and loads the header, so whatever comes after sees every log
+        self.flush()
+        with self._locked(), self._lock:
+            self._load_header()
 
-        with open(self.path, "rb") as file:
+    def flush(self) -> None:
+        """
+        Writes all the queued logs, this is done before anything reads the logs so they are never missing.
+        If that fails, the logs that aren't written go back to the front of the queue and the error is raised
+        """
+        with self._write_lock:
+            with self._queue_lock:
+                logs, self._queue = self._queue, []
+            if not logs:
+                return
+            try:
+                self._save_logs(logs)
+            finally:
+                if logs:
+                    with self._queue_lock:
+                        self._queue = logs + self._queue
+            self._error = None
+
+    def close(self) -> None:
+        """
+        Stops the background writer and writes the logs that are still queued.
+        Logging after this still works, but every log is then written right away
+        """
+        self._closed = True
+        _open_loggers.discard(self)
+        self._wake_up.set()
+        if self._writer is not None and self._writer is not threading.current_thread():
+            self._writer.join()
+        self._writer = None
+        self.flush()
+
+    def migrate_to_envelope_encryption(self) -> int:
+        """
+        Re-encrypts all the old RSA encrypted records in the log files with the envelope encryption.
+        :return: the amount of records that have been re-encrypted
+        """
+        self._sync()
+        with self._locked():
+            return sum(self._migrate_segment(segment_path) for segment_path, _ in self._all_segments())
+
+    @staticmethod
+    def _migrate_segment(segment_path: str) -> int:
+        # the new file is written next to the old one and then swapped in, so a crash halfway leaves the old file intact
+        if not path.exists(segment_path) or _is_block_file(segment_path):
+            return 0  # the blocks came after the envelope encryption, so they never have to be migrated
+
+        migrated = 0
+        temp_path = segment_path + ".tmp"
+        with open(segment_path, "rb") as old_file, open(temp_path, "wb") as new_file:
             while True:
-                # we read the data in chunks of 256 bytes because the encrypted data is 256 bytes long
-                encrypted_content = file.read(256)
+                encrypted_content = old_file.read(RECORD_SIZE)
                 if not encrypted_content:
                     break
-                content = decrypt_data(encrypted_content.hex())
-                logs.append(LogEntry.from_string(content))
+                if is_legacy_ciphertext(encrypted_content):
+                    encrypted_content = encrypt_record(decrypt_record(encrypted_content), RECORD_SIZE)
+                    migrated += 1
+                new_file.write(encrypted_content)
+        os.replace(temp_path, segment_path)
+        return migrated
 
-        return logs
+    def reencrypt_records(self, offset: int, count: int) -> tuple[int, int]:
+        """
+        Re-encrypts the records starting at this offset that are not encrypted with the active data key.
+        The records are overwritten in place, new logs can still be appended in the meantime.
+        :param offset: the offset (in bytes) of the first record, counted over all segments from old to new.
+            A sealed segment keeps its place in that order, so the offset stays valid when the active one is sealed
+        :param count: the maximum amount of records (or blocks) to re-encrypt
+        :return: the offset after the last handled record, and the amount of re-encrypted records (or blocks)
+        """
+        self._sync()
+        segment_start = 0
+        for segment_path, _ in self._all_segments(include_archive=True):
+            if not path.exists(segment_path):
+                continue
+            size = path.getsize(segment_path)
+            if offset < segment_start + size:
+                with self._locked():
+                    new_offset, reencrypted = self._reencrypt_segment(segment_path, offset - segment_start, count)
+                return segment_start + new_offset, reencrypted
+            segment_start += size
+        return offset, 0
 
-    def _save_log(self, log) -> None:
-        log_string = log.to_string()
-        encrypted_content = encrypt_data(log_string)
-        with open(self.path, "ab") as file:
-            file.write(encrypted_content)
+    def reencrypt_indexes(self, position: int, count: int) -> tuple[int, int]:
+        """
+        Rewrites the indexes that are not encrypted with the active data key, this comes after `reencrypt_records`.
+        :param position: the place of the first segment in the order of all segments from old to new (archives first)
+        :param count: the maximum amount of indexes to handle
+        :return: the position after the last handled segment, and the amount of rewritten indexes
+        """
+        self._sync()
+        segments = self._all_segments(include_archive=True)[position:position + count]
+        reencrypted = 0
+        with self._locked():  # the writer appends to the index of the active segment
+            for segment_path, _ in segments:
+                reencrypted += reencrypt_index(self._index_path(segment_path))
+        return position + len(segments), reencrypted
+
+    @staticmethod
+    def _reencrypt_segment(segment_path: str, offset: int, count: int) -> tuple[int, int]:
+        if _is_block_file(segment_path):
+            return Logger._reencrypt_blocks(segment_path, offset, count)
+
+        reencrypted = 0
+        with open(segment_path, "r+b") as file:
+            file.seek(offset)
+            encrypted_records = file.read(RECORD_SIZE * count)
+            # an incomplete record at the end is still being written, so we leave that one for the next batch
+            end = len(encrypted_records) - len(encrypted_records) % RECORD_SIZE
+            for start in range(0, end, RECORD_SIZE):
+                encrypted_content = encrypted_records[start:start + RECORD_SIZE]
+                if needs_reencryption(encrypted_content):
+                    file.seek(offset + start)
+                    file.write(encrypt_record(decrypt_record(encrypted_content), RECORD_SIZE))
+                    reencrypted += 1
+            file.flush()
+            os.fsync(file.fileno())
+        return offset + end, reencrypted
+
+    @staticmethod
+    def _reencrypt_blocks(segment_path: str, offset: int, count: int) -> tuple[int, int]:
+        # a block is re-encrypted to the exact same length, so it can be overwritten in place as well
+        offset = max(offset, len(BLOCK_MAGIC))
+        reencrypted = 0
+        with open(segment_path, "r+b") as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                frames = [frame for frame in _frames(view) if frame[0] >= offset][:count]
+                payloads = [_frame_payload(view, frame) for frame in frames]
+            for frame, encrypted_block in zip(frames, payloads):
+                if needs_reencryption(encrypted_block):
+                    new_block = reencrypt_block(encrypted_block)
+                    if len(new_block) != len(encrypted_block):
+                        # writing it anyway would overwrite the start of the next frame
+                        raise ValueError(f"Re-encrypted block at {frame[0]} in {segment_path} changed length")
+                    file.seek(frame[0] + _FRAME_HEADER.size)
+                    file.write(new_block)
+                    reencrypted += 1
+            file.flush()
+            os.fsync(file.fileno())
+        return (frames[-1][3] if frames else offset), reencrypted
 
     def log(self, username, description, additional_info, suspicious) -> None:
         username = username.replace(';', ' ')
         description = description.replace(';', ' ')
         additional_info = additional_info.replace(';', ' ')
-        self.current_index += 1
-        new_log = LogEntry(self.current_index, str(datetime.now().date()),
-                           str(datetime.now().time().strftime("%H:%M:%S")),
-                           username, description, additional_info, suspicious)
-        self._save_log(new_log)
+        # the id is given when the log is written (see `_save_logs`), another process could be logging as well
+        log = LogEntry(0, str(datetime.now().date()), str(datetime.now().time().strftime("%H:%M:%S")),
+                       username, description, additional_info, suspicious)
+        with self._queue_lock:
+            self._queue.append(log)
+            queued = len(self._queue)
 
-    def flag_logs_as_viewed(self):
-        hidden_log = LogEntry(self.current_index, str(datetime.now().date()),
-                              str(datetime.now().time().strftime("%H:%M:%S")), "...",
-                              HIDDEN_LOG, HIDDEN_LOG, False)
-        self._save_log(hidden_log)
+        if self._closed or self._error is not None:
+            self.flush()
+            return
+        self._start_writer()
+        if queued >= self.flush_count:
+            self._wake_up.set()
 
-    def _get_lasted_viewed(self) -> LogEntry | None:
-        last_viewed = [log for log in self._get_logs() if log.description == HIDDEN_LOG]
-        if last_viewed:
-            return last_viewed[-1]
-        return None
+    def flag_logs_as_viewed(self):
+        # everything up to the current id is now seen, so there are no unread risks anymore
+        self.flush()
+        with self._locked(), self._lock:
+            self._load_header()
+            self.viewed_id = self.current_index
+            self.unread_risks = 0
+            self._save_header()
 
     def new_risk_detected(self) -> bool:
-        last_viewed = self._get_lasted_viewed()
-        if not last_viewed:
-            for log in self._get_logs():
-                if log.suspicious == "True":
-                    return True
-
-        for log in self._get_logs():
-            if log.id > last_viewed.id and log.suspicious == "True":
-                return True
+        # the unread risks are counted while logging, so this doesn't have to read any logs
+        self._sync()
+        return self.unread_risks > 0
+
+    def get_all_logs(self) -> list[LogEntry]:
+        self._sync()
+        return _visible(self._get_logs())
+
+    # =================== #
+    #       QUERIES       #
+    # =================== #
 
+    def _records_in(self, segment_path: str) -> int:
+        # the amount of logs in a segment, without decrypting it. A sealed segment ends with its footer
+        if not path.exists(segment_path):
+            return 0
+        if _is_block_file(segment_path):
+            with open(segment_path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                for _, position, count, _ in _frames(view, reverse=True):
+                    if position != FOOTER_BLOCK:
+                        return position + count
+            return 0
+        records = path.getsize(segment_path) // RECORD_SIZE
+        return records if segment_path == self.path else max(records - 1, 0)
+
+    def _segment_records(self, segment_path: str, summary: dict) -> int:
+        # the sealed segments have the amount in their summary, the active one is in the header (after a sync)
+        if segment_path == self.path:
+            return self.record_count
+        return summary["records"] if summary.get("records") is not None else self._records_in(segment_path)
+
+    @staticmethod
+    def _read_entries(segment_path: str, positions) -> list[LogEntry]:
+        """
+        Reads and decrypts only the logs at these positions (record indexes) of the segment
+        :return: the logs in the same order as the positions
+        """
+        if not positions:
+            return []
+        # the file is mapped instead of read, so only the parts of the file we need are loaded
+        with open(segment_path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            if view[:len(BLOCK_MAGIC)] != BLOCK_MAGIC:
+                contents = decrypt_many([view[position * RECORD_SIZE:(position + 1) * RECORD_SIZE]
+                                         for position in positions], is_record=True)
+                return [LogEntry.from_string(content) for content in contents]
+
+            # the blocks are walked from the end, since most of the time the newest logs are wanted
+            remaining = set(positions)
+            frames = []
+            for frame in _frames(view, reverse=True):
+                if not remaining:
+                    break
+                _, first, count, _ = frame
+                if first == FOOTER_BLOCK:
+                    continue
+                wanted = {position for position in remaining if first <= position < first + count}
+                if wanted:
+                    frames.append(frame)
+                    remaining -= wanted
+            blocks = decrypt_blocks([_frame_payload(view, frame) for frame in frames])
+
+        contents = {}
+        for (_, first, _, _), entries in zip(frames, blocks):
+            contents.update(enumerate(entries, first))
+        return [LogEntry.from_string(contents[position]) for position in positions if position in contents]
+
+    def count_records(self) -> int:
+        """
+        :return: the amount of log records, this includes the hidden logs of older log files
+        """
+        self._sync()
+        return sum(self._segment_records(segment_path, summary) for segment_path, summary in self._all_segments())
+
+    def read_page(self, page: int, size: int, newest_first: bool = True) -> list[LogEntry]:
+        """
+        Reads a single page of logs, only the records (or blocks) of that page are decrypted. The position of a page
+        is found from the sizes of the old files and by walking the block frames from the end,
+        so opening the newest pages takes the same time no matter how big the logs are.
+        Note that the hidden logs of older log files take up a place too, so such a page can have one log less
+        :param page: the index of the page, starting at 0
+        :param size: the amount of logs per page
+        :param newest_first: if the pages start at the newest log (and every page is ordered from new to old)
+        """
+        self._sync()
+        segments = self._all_segments()
+        if newest_first:
+            segments.reverse()
+
+        skip = page * size
+        logs, taken = [], 0
+        for segment_path, summary in segments:
+            records = self._segment_records(segment_path, summary)
+            if skip >= records:
+                skip -= records
+                continue
+            take = min(size - taken, records - skip)
+            if newest_first:
+                positions = range(records - skip - 1, records - skip - take - 1, -1)
+            else:
+                positions = range(skip, skip + take)
+            logs += self._read_entries(segment_path, positions)
+            taken += take
+            skip = 0
+            if taken >= size:
+                break
+        return _visible(logs)
+
+    def get_recent_logs(self, count: int) -> list[LogEntry]:
+        """
+        Only reads the newest segments, until there are enough logs
+        :param count: the maximum amount of logs
+        :return: the newest logs, from old to new (same order as `get_all_logs`)
+        """
+        self._sync()
+        logs = []
+        for segment_path, summary in reversed(self._all_segments()):
+            if len(logs) >= count:
+                break
+            if summary["count"]:
+                logs = _visible(self._read_segment(segment_path)[0]) + logs
+        return logs[-count:] if count > 0 else []
+
+    def get_logs_between(self, start_date: str, end_date: str, include_archive: bool = False) -> list[LogEntry]:
+        """
+        Segments that don't overlap with these dates are skipped without being read
+        :param start_date: the first date (YYYY-MM-DD), inclusive
+        :param end_date: the last date (YYYY-MM-DD), inclusive
+        :param include_archive: if the archived logs should be searched as well
+        """
+        self._sync()
+        logs = []
+        for segment_path, summary in self._all_segments(include_archive):
+            if not summary["count"] or summary["last_date"] < start_date or summary["first_date"] > end_date:
+                continue
+            logs += [log for log in _visible(self._read_segment(segment_path)[0])
+                     if start_date <= log.date <= end_date]
+        return logs
+
+    def has_risks_since(self, log_id: int) -> bool:
+        """
+        Only a segment that has suspicious logs, and where this id falls in the middle of, has to be read
+        :param log_id: the id of the last log that doesn't count
+        :return: if there is any suspicious log with a higher id
+        """
+        self._sync()
+        for segment_path, summary in self._all_segments():
+            if not summary["suspicious"] or summary["last_id"] <= log_id:
+                continue
+            if summary["first_id"] > log_id:
+                return True
+            if any(log.id > log_id and str(log.suspicious) == "True"
+                   for log in _visible(self._read_segment(segment_path)[0])):
+                return True
         return False
 
-    def get_all_logs(self) -> list[LogEntry]:
-        return [log for log in self._get_logs() if log.description != HIDDEN_LOG]
+    def query(self, username: str = None, description: str = None, suspicious: bool = None,
+              start: str = None, end: str = None, include_archive: bool = False) -> list[LogEntry]:
+        """
+        Finds the logs that match all the given filters. The indexes of the segments are used to find the matching
+        records, so only those are decrypted. Segments outside the date range (or without risks) are skipped entirely
+        :param username: the username (not case sensitive)
+        :param description: the whole description (not case sensitive)
+        :param suspicious: if the log has to be suspicious or not
+        :param start: the first moment (yyyy-mm-dd, optionally followed by hh:mm:ss or a part of it), inclusive
+        :param end: the last moment (same format as start), inclusive
+        :param include_archive: if the archived logs should be searched as well
+        :return: the matching logs, from old to new
+        """
+        self._sync()
+        wanted_keys = []
+        if username is not None:
+            wanted_keys.append(f"user:{username.lower()}")
+        if description is not None:
+            wanted_keys.append(f"description:{description.lower()}")
+        if suspicious is not None:
+            wanted_keys.append(f"suspicious:{suspicious}")
+
+        def in_range(moment: str) -> bool:
+            # the moments are compared as strings, an end like "2024-05-01" includes the whole day
+            return (start is None or moment >= start) and (end is None or moment[:len(end)] <= end)
+
+        def matches(log: LogEntry) -> bool:
+            return ((username is None or log.username.lower() == username.lower())
+                    and (description is None or log.description.lower() == description.lower())
+                    and (suspicious is None or str(log.suspicious) == str(suspicious))
+                    and in_range(f"{log.date} {log.time}"))
+
+        logs = []
+        # the writer can't add to the index of the active segment while we read it (or catch it up)
+        with self._locked(), self._lock:
+            for segment_path, summary in self._all_segments(include_archive):
+                if not summary["count"] or (suspicious and not summary["suspicious"]):
+                    continue
+                if ((start is not None and summary["last_date"] < start[:10])
+                        or (end is not None and summary["first_date"] > end[:10])):
+                    continue
+
+                postings = self._get_segment_index(segment_path)
+                positions = None
+                for key in wanted_keys:
+                    positions = postings.get(key, set()) if positions is None else positions & postings.get(key, set())
+                if start is not None or end is not None:
+                    # the index only knows the hour, so the exact time is checked after decrypting
+                    hours = set()
+                    for key, key_positions in postings.items():
+                        if key.startswith("hour:") and (start is None or key[5:] >= start[:13]) \
+                                and (end is None or key[5:len(end) + 5] <= end[:13]):
+                            hours |= key_positions
+                    positions = hours if positions is None else positions & hours
+                if positions is None:
+                    positions = range(self._records_in(segment_path))
+
+                logs += [log for log in self._read_entries(segment_path, sorted(positions)) if matches(log)]
+        return _visible(logs)
+
+    def iter_encrypted_chunks(self, start_date: str = None, end_date: str = None, suspicious: bool = None,
+                              include_archive: bool = False, chunk_size: int = 1_000):
+        """
+        Walks over all the logs without decrypting them, so they can be decrypted somewhere else (like a worker pool).
+        Only one chunk is kept in memory at a time, and segments that can't match the filters are skipped.
+        :param start_date: the first date (YYYY-MM-DD), inclusive
+        :param end_date: the last date (YYYY-MM-DD), inclusive
+        :param suspicious: only the segments with suspicious logs are needed when this is True
+        :param chunk_size: the (rough) amount of logs per chunk
+        :return: a generator of (True if the chunk is made of blocks and False for records, the encrypted chunk)
+        """
+        self._sync()
+        for segment_path, summary in self._all_segments(include_archive):
+            if not summary["count"] or (suspicious and not summary["suspicious"]):
+                continue
+            if ((start_date is not None and summary["last_date"] < start_date)
+                    or (end_date is not None and summary["first_date"] > end_date)):
+                continue
+            if not path.exists(segment_path):
+                continue
+
+            records = self._records_in(segment_path)
+            with open(segment_path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                if view[:len(BLOCK_MAGIC)] != BLOCK_MAGIC:
+                    for start in range(0, records, chunk_size):
+                        yield False, [view[index * RECORD_SIZE:(index + 1) * RECORD_SIZE]
+                                      for index in range(start, min(start + chunk_size, records))]
+                    continue
+
+                chunk, logs_in_chunk = [], 0
+                for frame in _frames(view):
+                    if frame[1] == FOOTER_BLOCK or frame[1] >= records:
+                        continue
+                    chunk.append(_frame_payload(view, frame))
+                    logs_in_chunk += frame[2]
+                    if logs_in_chunk >= chunk_size:
+                        yield True, chunk
+                        chunk, logs_in_chunk = [], 0
+                if chunk:
+                    yield True, chunk
+
+    # =================== #
+    #       FOLLOW        #
+    # =================== #
+
+    def follow_cursor(self) -> dict:
+        """
+        :return: a cursor that points at the end of the logs, to give to `read_new_logs`
+        """
+        self._sync()
+        return {"first_id": self.active["first_id"], "offset": self.active_size, "last_id": self.current_index}
+
+    def read_new_logs(self, cursor: dict) -> tuple[list[LogEntry], dict]:
+        """
+        Reads only the logs that came after the cursor. This is cheap enough to call every second:
+        if the log file didn't grow, nothing is read at all, otherwise only the part after the cursor is decrypted.
+        :param cursor: the cursor from `follow_cursor`, or the one this method returned last time
+        :return: the new logs (from old to new) and the cursor to use next time
+        """
+        with self._queue_lock:
+            queued = bool(self._queue)
+        size_on_disk = path.getsize(self.path) if path.exists(self.path) else 0
+        if not queued and size_on_disk == cursor["offset"]:
+            return [], cursor
+
+        self._sync()
+        with self._lock:
+            if cursor["first_id"] is not None and cursor["first_id"] == self.active["first_id"]:
+                logs, offset = self._read_from_offset(self.path, cursor["offset"])
+            else:
+                # the segment the cursor was in has been sealed, so we continue in the segments that came after it
+                logs = []
+                for segment_path, summary in self._all_segments()[:-1]:
+                    if (summary["last_id"] or 0) > cursor["last_id"]:
+                        logs += self._read_segment(segment_path)[0]
+                active_logs, offset = self._read_from_offset(self.path, 0)
+                logs += active_logs
+            logs = [log for log in logs if log.id > cursor["last_id"]]
+            new_cursor = {"first_id": self.active["first_id"], "offset": offset,
+                          "last_id": logs[-1].id if logs else cursor["last_id"]}
+        return _visible(logs), new_cursor
+
+    @staticmethod
+    def _read_from_offset(segment_path: str, offset: int) -> tuple[list[LogEntry], int]:
+        """
+        :param offset: the offset (in bytes) of a frame or record in the segment
+        :return: the logs after this offset, and the offset after the last complete frame or record
+        """
+        if not path.exists(segment_path) or path.getsize(segment_path) <= offset:
+            return [], offset
 
-    def reset_fields(self) -> None:
-        self.login_attempts = 0
-        self.change_attempts = 0
+        if _is_block_file(segment_path):
+            with open(segment_path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                frames = [frame for frame in _frames(view, start=offset) if frame[1] != FOOTER_BLOCK]
+                blocks = decrypt_blocks([_frame_payload(view, frame) for frame in frames])
+            contents = [entry for entries in blocks for entry in entries]
+            end = frames[-1][3] if frames else max(offset, len(BLOCK_MAGIC))
+        else:
+            with open(segment_path, "rb") as file:
+                file.seek(offset)
+                content = file.read()
+            end = len(content) - len(content) % RECORD_SIZE
+            contents = decrypt_many([content[start:start + RECORD_SIZE] for start in range(0, end, RECORD_SIZE)],
+                                    is_record=True)
+            end += offset
+        return [LogEntry.from_string(content) for content in contents if not content.startswith(FOOTER_PREFIX)], end
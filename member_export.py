@@ -0,0 +1,69 @@
+import csv
+import json
+import time
+from functools import partial
+from pipeline import run_pipeline
+from encryption import decrypt_many
+from member_import import IMPORT_FIELDS
+
+if __name__ == "__main__":
+    raise SystemExit("This file is not meant to be run directly. Please run the main script called um_members.py")
+
+# The export is a pipeline of 3 stages that all run at the same time (see pipeline.py):
+#   read the rows from the db -> decrypt (spread over the worker pool) -> serialize and write
+# The fields have the same names as the columns of an import (see member_import.py), so an export can be imported.
+EXPORT_FORMATS = ("csv", "jsonl")
+EXPORT_FIELDS = ("id", *IMPORT_FIELDS)
+CHUNK_SIZE = 1_000
+
+
+def _decrypt_chunk(rows: list[tuple], fields: tuple[str]) -> list[tuple]:
+    """
+    :param rows: rows selected with `SELECT id, <the columns of these fields>, record`
+    :param fields: the selected fields (without the id)
+    :return: the id and the decrypted values of the fields, for every row
+    """
+    # a member stored as a row level record has all fields in one ciphertext, so all of them are decrypted,
+    # a member stored in separate columns only has the selected columns decrypted (the rest is not even selected)
+    records = iter(decrypt_many([row[-1] for row in rows if row[-1] is not None]))
+    columns = iter(decrypt_many([value for row in rows if row[-1] is None for value in row[1:-1]]))
+    positions = [IMPORT_FIELDS.index(field) for field in fields]
+    members = []
+    for row in rows:
+        if row[-1] is not None:
+            values = json.loads(next(records))
+            members.append((row[0], *(values[position] for position in positions)))
+        else:
+            members.append((row[0], *(next(columns) for _ in fields)))
+    return members
+
+
+def export_members(chunks, file_path: str, export_format: str = "csv", fields: tuple[str] = IMPORT_FIELDS) -> dict:
+    """
+    Writes the decrypted members to a file, without ever loading all of them in memory
+    :param chunks: an iterable with lists of rows, selected with `SELECT id, <the columns of these fields>, record`
+    :param file_path: the file to write to (it is overwritten)
+    :param export_format: "csv" or "jsonl" (one json object per line)
+    :param fields: the fields to export (besides the id), in the order of IMPORT_FIELDS
+    :return: the amount of exported members, the seconds it took and the exported members per second
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {export_format}")
+
+    started = time.perf_counter()
+    exported = 0
+    header = ("id", *fields)
+    with open(file_path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        if export_format == "csv":
+            writer.writerow(header)
+        for members in run_pipeline(chunks, partial(_decrypt_chunk, fields=fields)):
+            if export_format == "csv":
+                writer.writerows(members)
+            else:
+                file.writelines(json.dumps(dict(zip(header, member))) + "\n" for member in members)
+            exported += len(members)
+
+    seconds = time.perf_counter() - started
+    return {"exported": exported, "seconds": round(seconds, 3),
+            "members_per_second": round(exported / seconds) if seconds else exported}
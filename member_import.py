@@ -0,0 +1,119 @@
+import os
+import csv
+import json
+
+if __name__ == "__main__":
+    raise SystemExit("This file is not meant to be run directly. Please run the main script called um_members.py")
+
+# The file handling of the member import, the import itself is done by `Database.import_members` in backend.py.
+# A file is read in chunks, one chunk at a time, so the size of the file doesn't matter for the memory that is used.
+# The rows that can't be imported are written to a reject file next to it (with the reason),
+# and the progress is saved in the db with every batch, so an import that was interrupted continues where it left off.
+IMPORT_FORMATS = ("csv", "jsonl")
+# the columns of a csv file (or the keys of a json object), the same as the arguments of `Database.create_member`
+IMPORT_FIELDS = ("first_name", "last_name", "age", "gender", "weight", "street", "house_number", "zip_code", "city",
+                 "email", "phone")
+REJECT_FIELDS = ("row", "reason", *IMPORT_FIELDS)
+CHUNK_SIZE = 1_000
+
+
+def get_import_format(file_path: str) -> str | None:
+    """
+    :return: the format of the file based on its extension, or None if it is not a format that can be imported
+    """
+    extension = os.path.splitext(file_path)[1].lower().lstrip(".")
+    return extension if extension in IMPORT_FORMATS else None
+
+
+def get_reject_path(file_path: str) -> str:
+    return file_path + ".rejects.csv"
+
+
+def _parse_record(record: dict) -> tuple[tuple, str | None]:
+    """
+    :param record: a row of a csv file (as a dict) or a json object
+    :return: the values in the order of IMPORT_FIELDS, and what is wrong with the row (None if nothing)
+    """
+    if not isinstance(record, dict):
+        return (), "The row is not a json object."
+    missing = [field for field in IMPORT_FIELDS if record.get(field) is None]
+    values = tuple("" if record.get(field) is None else str(record[field]) for field in IMPORT_FIELDS)
+    if missing:
+        return values, f"Missing: {', '.join(missing)}."
+    if record.get(None):
+        # csv.DictReader puts the values that don't have a column under the None key
+        return values, "The row has more values than there are columns."
+    return values, None
+
+
+def _read_records(file):
+    """
+    :return: a generator with a (record, error) for every row of a jsonl file, the record is None if it is not json
+    """
+    for line in file:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line), None
+        except json.JSONDecodeError:
+            yield None, "The row is not valid json."
+
+
+def read_chunks(file_path: str, import_format: str, skip_rows: int = 0, chunk_size: int = CHUNK_SIZE):
+    """
+    Reads the file one chunk at a time. The rows are counted from 1 and empty lines (in jsonl) are not counted
+    :param skip_rows: the amount of rows at the start that have already been imported (from the saved progress)
+    :return: a generator with (the row number of the first row, the values of every row, the errors per row index)
+        the values of a row are in the order of IMPORT_FIELDS
+    """
+    with open(file_path, "r", newline="", encoding="utf-8-sig") as file:
+        if import_format == "csv":
+            reader = csv.DictReader(file)
+            missing = [field for field in IMPORT_FIELDS if field not in (reader.fieldnames or [])]
+            if missing:
+                raise ValueError(f"The csv file is missing the columns: {', '.join(missing)}")
+            records = ((record, None) for record in reader)
+        else:
+            records = _read_records(file)
+
+        first_row = skip_rows + 1
+        rows, errors = [], {}
+        for row_number, (record, error) in enumerate(records, 1):
+            if row_number <= skip_rows:
+                continue
+            if error is None:
+                values, error = _parse_record(record)
+            else:
+                values = ()
+            if error is not None:
+                errors[len(rows)] = [error]
+            rows.append(values)
+            if len(rows) == chunk_size:
+                yield first_row, rows, errors
+                first_row += len(rows)
+                rows, errors = [], {}
+        if rows:
+            yield first_row, rows, errors
+
+
+def open_reject_file(reject_path: str, valid_length: int = 0):
+    """
+    :param valid_length: the length of the reject file when the progress was last saved, anything after it is from
+        a batch that has not been saved, that batch is done again so its rejects are thrown away. 0 starts a new file
+    :return: the opened file and a csv writer for it
+    """
+    if valid_length and os.path.exists(reject_path):
+        file = open(reject_path, "r+", newline="", encoding="utf-8")
+        file.truncate(valid_length)
+        file.seek(valid_length)
+        return file, csv.writer(file)
+    file = open(reject_path, "w", newline="", encoding="utf-8")
+    writer = csv.writer(file)
+    writer.writerow(REJECT_FIELDS)
+    return file, writer
+
+
+def write_rejects(writer, first_row: int, rows: list[tuple], row_errors: dict[int, list[str]]) -> None:
+    for index, errors in sorted(row_errors.items()):
+        values = rows[index] or ("",) * len(IMPORT_FIELDS)
+        writer.writerow((first_row + index, " ".join(errors), *values))
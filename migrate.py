@@ -0,0 +1,67 @@
+import sys
+import time
+from backend import (setup_database, close_database, migrate_to_envelope_encryption,
+                     migrate_to_row_level_members, start_key_rotation, run_key_rotation_batch,
+                     migrate_to_blob_storage, archive_logs)
+
+if __name__ != '__main__':
+    raise SystemExit("This file is not meant to be imported. "
+                     "Please run this script directly to migrate the database and the logs")
+
+# This script is used to update the data of an existing installation after the way we store it has changed.
+# Make a backup before running it!
+# Usage: python migrate.py <command>
+
+
+def envelope() -> None:
+    fields, logs = migrate_to_envelope_encryption()
+    print(f"Re-encrypted {fields} database fields and {logs} log records with envelope encryption")
+
+
+def row_members() -> None:
+    members = migrate_to_row_level_members()
+    print(f"Moved {members} members to a single encrypted record")
+
+
+def blob() -> None:
+    values = migrate_to_blob_storage()
+    print(f"Converted {values} hex encoded values into BLOBs")
+
+
+def rotate() -> None:
+    # this can run while the app is being used, if it gets interrupted, just run it again to continue
+    checkpoint = start_key_rotation()
+    print(f"Rotating to key {checkpoint['key_id']}")
+    while checkpoint:
+        print(f"  {checkpoint['stage']}: at {checkpoint['position']}, re-encrypted {checkpoint['reencrypted']}")
+        checkpoint = run_key_rotation_batch()
+        time.sleep(0.05)  # small pause between the batches, so the app doesn't have to wait on us
+    print("Key rotation finished")
+
+
+def archive() -> None:
+    try:
+        logs = archive_logs()
+    except RuntimeError as e:
+        print(e)
+        return
+    print(f"Archived {logs} logs")
+
+
+COMMANDS = {
+    "envelope": envelope,
+    "row-members": row_members,
+    "rotate": rotate,
+    "blob": blob,
+    "archive": archive,
+}
+
+if len(sys.argv) != 2 or sys.argv[1] not in COMMANDS:
+    print(f"Usage: python migrate.py <{'|'.join(COMMANDS.keys())}>")
+    exit(1)
+
+try:
+    setup_database()
+    COMMANDS[sys.argv[1]]()
+finally:
+    close_database()
@@ -0,0 +1,101 @@
+import queue
+import threading
+
+if __name__ == "__main__":
+    raise SystemExit("This file is not meant to be run directly. Please run the main script called um_members.py")
+
+# A pipeline runs a few stages at the same time, every stage on its own thread:
+#   source (like reading a file) -> stage 1 -> stage 2 -> ... -> the caller (like writing a file)
+# The stages are connected with small queues, so there are never more than a few chunks in memory,
+# no matter how big the input is. If a stage is faster than the next one, it just waits for room in the queue.
+QUEUE_SIZE = 4  # the maximum amount of chunks that wait between two stages
+# When the caller stops early (an error, or it doesn't read everything), the pipeline is cancelled.
+# The stages don't wait on a queue forever then, they check every POLL_INTERVAL seconds if they have to stop
+POLL_INTERVAL = 0.1
+
+_DONE = object()  # put in a queue after the last chunk
+
+
+class _StageError:
+    def __init__(self, error: BaseException) -> None:
+        self.error = error
+
+
+def _put(outbox: queue.Queue, item, cancelled: threading.Event) -> bool:
+    """
+    Waits for room in the queue, unless the pipeline is cancelled
+    :return: if the item has been put in the queue
+    """
+    while not cancelled.is_set():
+        try:
+            outbox.put(item, timeout=POLL_INTERVAL)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _receive(inbox: queue.Queue, cancelled: threading.Event):
+    """
+    :return: a generator with the items from the queue until the last one, or until the pipeline is cancelled
+    """
+    while not cancelled.is_set():
+        try:
+            item = inbox.get(timeout=POLL_INTERVAL)
+        except queue.Empty:
+            continue
+        if item is _DONE:
+            return
+        yield item
+
+
+def _run_stage(function, inbox, outbox: queue.Queue, cancelled: threading.Event) -> None:
+    """
+    Runs a stage on its own thread, every item from the inbox is given to the function and the result goes
+    into the outbox. When something goes wrong, the error is passed on so the caller can raise it
+    :param inbox: a queue, or an iterable for the first stage
+    """
+    items = None
+    try:
+        items = _receive(inbox, cancelled) if isinstance(inbox, queue.Queue) else iter(inbox)
+        for item in items:
+            if isinstance(item, _StageError):
+                _put(outbox, item, cancelled)
+                return
+            if not _put(outbox, function(item), cancelled):
+                return
+        _put(outbox, _DONE, cancelled)
+    except BaseException as e:
+        _put(outbox, _StageError(e), cancelled)
+    finally:
+        if hasattr(items, "close"):
+            items.close()  # a generator as the source closes its files (or cursors) right away, also when cancelled
+
+
+def run_pipeline(source, *stages):
+    """
+    :param source: an iterable (like a generator) with the chunks, it is read on its own thread
+    :param stages: functions that are called with every chunk, one after the other
+    :return: a generator with the results of the last stage, in the same order as the source.
+        When it is not read until the end (or the caller raises while reading it), all the stages are stopped
+    """
+    cancelled = threading.Event()
+    inbox = queue.Queue(QUEUE_SIZE)
+    threads = [threading.Thread(target=_run_stage, args=(lambda chunk: chunk, source, inbox, cancelled), daemon=True)]
+    for stage in stages:
+        outbox = queue.Queue(QUEUE_SIZE)
+        threads.append(threading.Thread(target=_run_stage, args=(stage, inbox, outbox, cancelled), daemon=True))
+        inbox = outbox
+    for thread in threads:
+        thread.start()
+
+    try:
+        for result in _receive(inbox, cancelled):
+            if isinstance(result, _StageError):
+                raise result.error
+            yield result
+    finally:
+        # a stage only finishes the chunk it is working on, so this doesn't take long
+        cancelled.set()
+        for thread in threads:
+            thread.join()
@@ -34,9 +34,12 @@ try:
     existing_members = db.get_all_members()
     existing_emails = [member.email for member in existing_members]
 
+    # the members are created in one batch at the end
+    new_members = []
+
     def add_member(*args):
         if not args[9] in existing_emails:
-            db.create_member(*args)
+            new_members.append(args)
 
     add_member('John', 'doe', '25', 'Male', '80', 'Main street', '1', '1234AB', 'Amsterdam',
                'john.doe@gmail.com', '12345678')
@@ -68,6 +71,7 @@ try:
                'karen.miller@example.com', '12341111')
     add_member('Liam', 'Taylor', '31', r_gender(), '72', 'Palm street', '60', '2345YZ', r_city(),
                'liam.taylor@example.com', '12342222')
+    db.create_members_bulk(new_members)
 
     db.create_consultant('consultant', 'Consultant_123?', 'Consultant', 'User')
     db.create_admin('sir_admin1', 'AdminAdmin_123?', 'Admin', 'User')
@@ -0,0 +1,55 @@
+import os
+import sys
+import importlib.util
+from os import path
+
+import pytest
+
+# The logs of the app are in logging.py, which has the same name as the logging module of python (that pytest uses).
+# So the folder of the app is added at the end of the path, then its other modules are found but not its logging.py,
+# and that one is loaded under another name. Run the tests with `pytest tests` from the folder of the app
+# (not with `python -m pytest`, that puts the folder of the app in front of the path).
+APP_PATH = path.dirname(path.dirname(path.abspath(__file__)))
+sys.path.append(APP_PATH)
+
+_spec = importlib.util.spec_from_file_location("um_logging", path.join(APP_PATH, "logging.py"))
+um_logging = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(um_logging)
+
+
+@pytest.fixture(scope="session")
+def keys(tmp_path_factory):
+    # the keys are made once (in a folder of their own), after that they stay loaded for all the tests
+    import encryption
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("keys"))
+    try:
+        encryption.initialize_keys()
+    finally:
+        os.chdir(cwd)
+    yield
+    encryption.shutdown_pool()
+
+
+@pytest.fixture
+def log_module():
+    return um_logging
+
+
+@pytest.fixture
+def make_logger(keys, tmp_path, monkeypatch):
+    """
+    :return: a function that opens a Logger on logs.bin in an empty folder (the same file every time),
+        the loggers are closed after the test
+    """
+    monkeypatch.chdir(tmp_path)
+    loggers = []
+
+    def make():
+        logger = um_logging.Logger(str(tmp_path / "logs.bin"))
+        loggers.append(logger)
+        return logger
+
+    yield make
+    for logger in loggers:
+        logger.close()
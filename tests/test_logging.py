@@ -0,0 +1,155 @@
+from os import path
+from datetime import datetime
+
+from encryption import encrypt_block, decrypt_block, encrypt_record
+
+
+def _log(logger, count: int, first: int = 0) -> None:
+    for i in range(first, first + count):
+        logger.log("alice" if i % 2 else "bob", "Logged in", f"attempt {i}", str(i % 5 == 0))
+    logger.flush()
+
+
+def test_block_round_trip(log_module, make_logger):
+    entries = ["1;2024-01-01;10:00:00;bob;Logged in;;False", "ünïcode;and a much longer entry " * 20, ""]
+    assert decrypt_block(encrypt_block(entries)) == entries
+
+    logger = make_logger()
+    _log(logger, 25)
+    assert log_module._is_block_file(logger.path)
+    logs, footer = log_module.Logger._read_segment(logger.path)
+    assert footer is None
+    assert [log.id for log in logs] == list(range(1, 26))
+    assert [log.additional_info for log in logs[:3]] == ["attempt 0", "attempt 1", "attempt 2"]
+    assert [log.username for log in logs[:2]] == ["bob", "alice"]
+
+
+def test_reverse_frame_walk_on_a_truncated_file(log_module, make_logger):
+    logger = make_logger()
+    for batch in range(3):
+        _log(logger, 4, batch * 4)  # every flush is one frame
+    logger.close()
+    with open(logger.path, "rb") as file:
+        content = file.read()
+    frames = list(log_module._frames(content))
+    assert [(position, count) for _, position, count, _ in frames] == [(0, 4), (4, 4), (8, 4)]
+    assert list(log_module._frames(content, reverse=True)) == frames[::-1]
+
+    # a crash in the middle of writing the last frame
+    with open(logger.path, "wb") as file:
+        file.write(content[:-5])
+    assert list(log_module._frames(content[:-5], reverse=True)) == frames[:2][::-1]
+
+    # the incomplete frame is left out when reading, and cut off before the next write
+    logger = make_logger()
+    assert [log.id for log in logger.get_all_logs()] == list(range(1, 9))
+    _log(logger, 2, 100)
+    logs = logger.get_all_logs()
+    assert [log.id for log in logs] == list(range(1, 11))
+    assert [log.additional_info for log in logs[-2:]] == ["attempt 100", "attempt 101"]
+
+
+def test_incomplete_frame_is_cut_off_before_sealing(log_module, make_logger, monkeypatch):
+    logger = make_logger()
+    _log(logger, 6)
+    with open(logger.path, "rb") as file:
+        content = file.read()
+    # a crash in the middle of writing the next frame, and then the next batch seals the segment first
+    with open(logger.path, "ab") as file:
+        file.write(content[len(log_module.BLOCK_MAGIC):][:30])
+    monkeypatch.setattr(log_module, "SEGMENT_MAX_RECORDS", 6)
+    _log(logger, 2, 6)
+
+    assert len(logger.segments) == 1
+    sealed_path = path.join(logger.segments_path, logger.segments[0]["name"])
+    logs, footer = log_module.Logger._read_segment(sealed_path)
+    assert [log.id for log in logs] == list(range(1, 7))
+    assert footer["last_id"] == 6
+    assert [log.id for log in make_logger().get_all_logs()] == list(range(1, 9))
+
+
+def test_reencrypted_blocks_keep_their_length(log_module, make_logger, monkeypatch):
+    import encryption
+    logger = make_logger()
+    for batch in range(3):
+        _log(logger, 10, batch * 10)
+    size = path.getsize(logger.path)
+
+    # a key rotation, without touching the keyring on disk
+    new_key_id = max(encryption._data_keys) + 1
+    monkeypatch.setitem(encryption._data_keys, new_key_id, encryption.AESGCM.generate_key(bit_length=256))
+    monkeypatch.setattr(encryption, "_active_key_id", new_key_id)
+    assert logger.reencrypt_records(0, 100) == (size, 3)
+
+    assert path.getsize(logger.path) == size
+    with open(logger.path, "rb") as file:
+        content = file.read()
+    assert not any(encryption.needs_reencryption(log_module._frame_payload(content, frame))
+                   for frame in log_module._frames(content))
+    assert [log.id for log in make_logger().get_all_logs()] == list(range(1, 31))
+
+
+def test_legacy_file_is_read_and_then_sealed(log_module, make_logger):
+    today = str(datetime.now().date())
+    legacy_logs = [log_module.LogEntry(i, today, "10:00:00", "legacy", "Logged in", "", "False") for i in range(1, 6)]
+    with open("logs.bin", "wb") as file:
+        for log in legacy_logs:
+            file.write(encrypt_record(log.to_string(), log_module.RECORD_SIZE))
+        file.write(encrypt_record("6;" + today, log_module.RECORD_SIZE)[:100])  # a crash halfway through a record
+
+    logger = make_logger()
+    assert not log_module._is_block_file(logger.path)
+    assert [log.id for log in logger.get_all_logs()] == [1, 2, 3, 4, 5]
+    assert logger.count_records() == 5
+
+    # the new logs go in blocks, so the old file is sealed (with a footer) first
+    _log(logger, 1)
+    assert log_module._is_block_file(logger.path)
+    assert len(logger.segments) == 1
+    sealed_path = path.join(logger.segments_path, logger.segments[0]["name"])
+    footer = log_module.Logger._read_footer(sealed_path)
+    assert (footer["first_id"], footer["last_id"], footer["count"]) == (1, 5, 5)
+    assert [log.id for log in logger.get_all_logs()] == [1, 2, 3, 4, 5, 6]
+    assert logger.count_records() == 6
+
+
+def test_read_page_and_query_across_sealed_and_active_segments(log_module, make_logger, monkeypatch):
+    monkeypatch.setattr(log_module, "SEGMENT_MAX_RECORDS", 10)
+    logger = make_logger()
+    _log(logger, 25)
+    assert [(segment["first_id"], segment["last_id"]) for segment in logger.segments] == [(1, 10), (11, 20)]
+    assert logger.count_records() == 25
+
+    for reader in (logger, make_logger()):  # also from a new logger, that only knows what is on the disk
+        assert [log.id for log in reader.read_page(0, 7)] == list(range(25, 18, -1))
+        assert [log.id for log in reader.read_page(1, 7)] == list(range(18, 11, -1))
+        assert [log.id for log in reader.read_page(1, 7, newest_first=False)] == list(range(8, 15))
+        assert [log.id for log in reader.read_page(3, 7)] == [4, 3, 2, 1]
+        newest_first = [log.id for page in range(7) for log in reader.read_page(page, 4)]
+        assert newest_first == list(range(25, 0, -1))
+
+        assert [log.id for log in reader.query(username="alice")] == list(range(2, 26, 2))
+        assert [log.id for log in reader.query(username="BOB", suspicious=True)] == [1, 11, 21]
+        assert reader.query(username="nobody") == []
+
+
+def test_archive_blocks_run_across_segments(log_module, make_logger, monkeypatch):
+    monkeypatch.setattr(log_module, "SEGMENT_MAX_RECORDS", 10)
+    monkeypatch.setattr(log_module, "ARCHIVE_BLOCK_SIZE", 3)
+    logger = make_logger()
+    _log(logger, 25)
+    assert logger.archive(older_than_days=-1) == 20  # a cutoff of tomorrow, so the logs of today are old enough
+    assert logger.segments == []
+
+    archive_path = path.join(logger.archive_path, logger.archives[0]["name"])
+    with open(archive_path, "rb") as file:
+        content = file.read()
+    blocks = [(position, count) for _, position, count, _ in log_module._frames(content)]
+    assert blocks == [(0, 3), (3, 3), (6, 3), (9, 3), (12, 3), (15, 3), (18, 2), (log_module.FOOTER_BLOCK, 0)]
+    logs, footer = log_module.Logger._read_segment(archive_path)
+    assert [log.id for log in logs] == list(range(1, 21))
+    assert footer["records"] == 20
+
+    for reader in (logger, make_logger()):
+        assert [log.id for log in reader.query(username="alice", include_archive=True)] == list(range(2, 26, 2))
+        assert [log.id for log in reader.query(username="alice")] == list(range(22, 26, 2))
@@ -1,11 +1,15 @@
 import time
-from backend import get_current_user, setup_database, close_database, Database, logout_user
+from backend import setup_database, close_database, Database
 from component_library import (paginated_single_select, password_input, set_toast, clear_terminal, set_multiple_toasts,
-                               COLOR_ENABLED, COLOR_CODES, column_based_single_select)
-from classes import UserType, Member, User
+                               COLOR_ENABLED, COLOR_CODES, column_based_single_select, lazy_paginated_single_select)
+from classes import UserType, Member, User, Session, preload
 from validation import CITY_LIST, GENDER_LIST
+from member_import import IMPORT_FIELDS
 from encryption import compare_passwords
 
+# the session of the user that is logged in on this terminal, every action is done with `Database(_session)`
+_session: Session = None
+
 
 def main():
     setup_database()
@@ -13,7 +17,7 @@ def main():
 
     while True:
         clear_terminal()
-        current_user = get_current_user()
+        current_user = _session.user if _session else None
         if not current_user:
             startup_menu()
         elif current_user.type == UserType.CONSULTANT:
@@ -68,13 +72,14 @@ def admin_menu():
     always_red = COLOR_CODES['red']
     always_reset = COLOR_CODES['end']
 
-    db = Database()
+    db = Database(_session)
     log_notice = f"{always_green}No new risks{always_reset}"
     if db.log_risk_detected():
         log_notice = f"{always_red}Unread Risk detected!{always_reset}"
 
     options = [f"{red}Logout{reset}", "Reset my password", "View member", "View users",
-               "Make a backup", "Restore a backup", f"View logs: {log_notice}"]
+               "Make a backup", "Restore a backup", f"View logs: {log_notice}", "Export logs",
+               "Export members"]
     # editing and deleting can maybe be combined
     option_index = column_based_single_select("Main Menu", options)
 
@@ -93,6 +98,10 @@ def admin_menu():
         restore_backup()
     elif option_index == 6:  # view logs
         view_logs()
+    elif option_index == 7:  # export the logs to a file
+        export_logs()
+    elif option_index == 8:  # export the members to a file
+        export_members()
     else:
         set_toast("Invalid option!", "red")
 
@@ -108,20 +117,35 @@ def members_index_page():
     tried_adding_member = False  # this flag only ensures that if adding a member failed. that it will not overwrite
     # the toast with "no results found" but instead will display the error message from the failed creation
 
-    db = Database()
-    members = db.get_all_members()
-    if members is None:
+    db = Database(_session)
+    total = db.count_members()
+    if total is None:
         set_multiple_toasts(db.get_errors(), "red")
         return
 
     header = f"    {'ID':<11.11} {'Full Name':<30.30} {'Age':<4.4} {'Email':<30.30}"
     header += "\n" + ('-' * len(header))
     search_term = ''  # must be able to search on: id, first name, last name, address, email address and phone number
+    persisted_options = {
+        'B': "Back",
+        "S": f"{yellow}Search{end}",
+        "A": f"{green}Add new member{end}",
+        "I": f"{green}Import members from a file{end}",
+    }
+
+    def member_option(mem: Member) -> str:
+        real_name = f"{mem.first_name} {mem.last_name}"
+        return f"{str(mem.id):<11.11} {real_name:<30.30} {str(mem.age):<4.4} {mem.email:<30.30}"
+
     while True:
-        filtered_members = []
-        for mem in members:
-            matches_search = not search_term
-            if search_term:
+        if search_term:
+            # the data is encrypted, so searching still has to go through (and decrypt) all members
+            members = db.get_all_members()
+            # the members are only decrypted for the fields we actually show (or search on), and all in one go
+            preload(members, "first_name", "last_name", "age", "email", "street_name", "house_number", "zip_code",
+                    "phone", "city")
+            filtered_members = []
+            for mem in members:
                 matches_search = (search_term.lower() in str(mem.id) or
                                   search_term.lower() in (mem.first_name + " " + mem.last_name).lower() or
                                   search_term.lower() in (mem.street_name + " " + mem.house_number).lower() or
@@ -129,35 +153,49 @@ def members_index_page():
                                   search_term.lower() in mem.zip_code.lower() or
                                   search_term.lower() in mem.phone.lower() or
                                   search_term.lower() in mem.city.lower())
+                if matches_search:
+                    filtered_members.append(mem)
 
-            if matches_search:
-                filtered_members.append(mem)
-
-        options = []
-        for mem in filtered_members:
-            real_name = f"{mem.first_name} {mem.last_name}"
-            options.append(f"{str(mem.id):<11.11} {real_name:<30.30} {str(mem.age):<4.4} {mem.email:<30.30}")
-
-        if not options and not tried_adding_member:
-            set_toast("No results found!", "red")
-        clear_terminal()
-        page_result = paginated_single_select(header, options, persist_toast=True, persisted_options={
-            'B': "Back",
-            "S": f"{yellow}Search{end}",
-            "A": f"{green}Add new member{end}",
-        })
+            if not filtered_members and not tried_adding_member:
+                set_toast("No results found!", "red")
+            clear_terminal()
+            page_result = paginated_single_select(header, [member_option(mem) for mem in filtered_members],
+                                                  persist_toast=True, persisted_options=persisted_options)
+            selected_member = filtered_members[page_result] if page_result >= 0 else None
+        else:
+            # without a search, only the page that is shown is loaded (and decrypted).
+            # Every page starts after the last id of the page before it, the pages are always visited one by one
+            after_ids = {0: None}
+            shown_members: dict[int, Member] = {}
+
+            def load_page(page: int, size: int) -> list[str]:
+                page_members = db.get_members_page(after_ids[page], size)
+                preload(page_members, "first_name", "last_name", "age", "email")
+                # when members have been deleted (by someone else) since they were counted, a page can be empty,
+                # then the next page just starts at the same place (and is empty as well)
+                after_ids[page + 1] = page_members[-1].id if page_members else after_ids[page]
+                for index, mem in enumerate(page_members):
+                    shown_members[page * size + index] = mem
+                return [member_option(mem) for mem in page_members]
+
+            if not total and not tried_adding_member:
+                set_toast("No results found!", "red")
+            clear_terminal()
+            page_result = lazy_paginated_single_select(header, total, load_page, persist_toast=True,
+                                                       persisted_options=persisted_options)
+            selected_member = shown_members.get(page_result)
 
         tried_adding_member = False
         search_term = ''
         if page_result == -1:
             return
-        elif page_result >= 0:
-            made_changes = _member_details(filtered_members[page_result])
+        elif selected_member:
+            made_changes = _member_details(selected_member)
             # the page does not return here. So we make use of the stack
             # to go back in to this loop after the _view_member function returns
             if made_changes:
                 # this boolean is nothing more than a bit of optimization. so it won't do a query if noting changed
-                members = db.get_all_members()
+                total = db.count_members()
         elif page_result == -2:
             clear_terminal()
             search_term = input("Search term: ")
@@ -168,7 +206,11 @@ def members_index_page():
             success = _add_member()
             if success:
                 # this boolean is nothing more than a bit of optimization. so it won't do a query if noting changed
-                members = db.get_all_members()
+                total = db.count_members()
+        elif page_result == -4:
+            tried_adding_member = True
+            if _import_members():
+                total = db.count_members()
 
 
 def _member_details(member: Member) -> bool:
@@ -189,7 +231,7 @@ def _member_details(member: Member) -> bool:
     print(f"Email: {member.email}")
     print(f"Phone: {member.phone}")
 
-    allowed_to_delete = get_current_user().type == UserType.SUPER_ADMIN or get_current_user().type == UserType.ADMIN
+    allowed_to_delete = _session.user.type == UserType.SUPER_ADMIN or _session.user.type == UserType.ADMIN
     # note that his boolean only ensures that the option is shown (or not)
     # however, there is also an extra authorization check for all queries. including this delete query
     # meaning that even if someone would get through our cool interface,
@@ -207,6 +249,31 @@ def _member_details(member: Member) -> bool:
     return False
 
 
+def _import_members() -> bool:
+    """
+    :return: returns True if any member has been imported. otherwise it will return false
+    """
+    clear_terminal()
+    print("Import members from a csv file (with a header row) or a jsonl file (a json object on every line)")
+    print(f"Columns: {', '.join(IMPORT_FIELDS)}")
+    file_path = input("File: ").strip().strip('"')
+    if not file_path:
+        set_toast("")
+        return False
+
+    db = Database(_session)
+    result = db.import_members(file_path)
+    if any(db.get_errors()):
+        set_multiple_toasts(db.get_errors(), "red")
+        return False
+    message = f"Imported {result['created']} members ({result['rows_per_second']} rows per second)"
+    if result["rejected"]:
+        set_multiple_toasts([message, f"{result['rejected']} rows rejected, see {result['reject_path']}"], "yellow")
+    else:
+        set_toast(message, "green")
+    return result["created"] > 0
+
+
 def _edit_member(member: Member) -> bool:
     """
     :return: returns True if the member has been updated. otherwise it will return false
@@ -254,7 +321,7 @@ def _edit_member(member: Member) -> bool:
     clear_terminal()
     city_name = CITY_LIST[column_based_single_select(f"City:  {currently(member.city)}", CITY_LIST, persist_toast=True)]
 
-    db = Database()
+    db = Database(_session)
     db.update_member(member.id, first_name, last_name, age, gender, weight, street,
                      house_number, zip_code, city_name, email, phone_number)
 
@@ -278,7 +345,7 @@ def _delete_member(member: Member) -> bool:
         print("[N] No")
         chose = input("Chose an option: ")
         if chose.lower() == "y" or chose.lower() == "yes":
-            db = Database()
+            db = Database(_session)
             db.delete_member(member.id)
             if any(db.get_errors()):
                 set_multiple_toasts(db.get_errors(), "red")
@@ -323,7 +390,7 @@ def _add_member() -> bool:
     clear_terminal()
     city_name = CITY_LIST[column_based_single_select("City:", CITY_LIST, persist_toast=True)]
 
-    db = Database()
+    db = Database(_session)
     db.create_member(first_name, last_name, age, gender, weight, street,
                      house_number, zip_code, city_name, email, phone_number)
 
@@ -346,16 +413,19 @@ def login():
     password = password_input("Password: ")
     # we don't have to validate the input since if the input is not allowed,
     # then it's not in the db anyway and will return a invalid login anyway
+    global _session
     db = Database()
-    current_user = db.login_user(username, password)
-    if current_user:
-        set_toast(f"Welcome {current_user.username}!", "green")
+    _session = db.login_user(username, password)
+    if _session:
+        set_toast(f"Welcome {_session.user.username}!", "green")
     else:
         set_multiple_toasts(db.get_errors(), "red")
 
 
 def logout(toast_message: str, toast_color: str) -> None:
-    logout_user()  # resetting current user in the database context/module
+    global _session
+    Database(_session).logout_user()
+    _session = None
     set_toast(toast_message, toast_color)
     clear_terminal()
     time.sleep(0.5)  # to ensure the user sees the goodbye message
@@ -371,7 +441,7 @@ def edit_my_password() -> None:
         set_toast("Passwords do not match!", "red")
         return
 
-    db = Database()
+    db = Database(_session)
     db.edit_my_password(old_password, new_password)
     if any(db.get_errors()):
         set_multiple_toasts(db.get_errors(), "red")
@@ -379,41 +449,121 @@ def edit_my_password() -> None:
         set_toast("Password changed successfully!", "green")
 
 
-def view_logs() -> None:
-    db = Database()
-    logs = db.get_logs()
-    if any(db.get_errors()):
-        set_multiple_toasts(db.get_errors(), "red")
-        return
-
+def _log_colors() -> tuple[str, str, str, str, str]:
     red, green, end = (COLOR_CODES['red'], COLOR_CODES['green'], COLOR_CODES['end'])
     white = gray = ''
     if COLOR_ENABLED:
         white, gray = (COLOR_CODES['white'], COLOR_CODES['gray'])
+    return red, green, white, gray, end
+
+
+def _logs_header() -> str:
+    _, _, white, _, end = _log_colors()
     header = f"{white}ID | yyyy-mm-dd hh:mm:ss | {'Username':<11}  {'Description':<30} suspicious{end}"
-    header += "\n" + ('-' * len(header))
+    return header + "\n" + ('-' * len(header))
 
-    if db.log_risk_detected():
-        set_toast("Unread risk detected in logs!", "red")
-    else:  # this flag was not a requirement, however, it is really easy to do and adds to the usability of the system
-        set_toast("No unread risk detected in logs!", "green")
-
-    humanized_logs = []
-    for log in reversed(logs):  # we want to start from the most recent log
-        suspicious_text = f"{red}Risk{end}" if log.suspicious == "True" else f"{green}Safe{end}"
-        main_part = (f"{gray}{str(log.id).zfill(3)}{white}| {gray}{log.date} {log.time} {white}| "
-                     f"{log.username:<11.11}  {log.description:<30}{suspicious_text:>4}{end}")
-        if log.additional_info:
-            main_part += f"\n   |{'':>21}| {gray}{log.additional_info}{end}"
-        humanized_logs.append(main_part)
 
+def _humanize_log(log) -> str:
+    red, green, white, gray, end = _log_colors()
+    suspicious_text = f"{red}Risk{end}" if log.suspicious == "True" else f"{green}Safe{end}"
+    main_part = (f"{gray}{str(log.id).zfill(3)}{white}| {gray}{log.date} {log.time} {white}| "
+                 f"{log.username:<11.11}  {log.description:<30}{suspicious_text:>4}{end}")
+    if log.additional_info:
+        main_part += f"\n   |{'':>21}| {gray}{log.additional_info}{end}"
+    return main_part
+
+
+def view_logs() -> None:
+    while True:
+        db = Database(_session)
+        log_count = db.count_logs()
+        if any(db.get_errors()):
+            set_multiple_toasts(db.get_errors(), "red")
+            return
+
+        if db.log_risk_detected():
+            set_toast("Unread risk detected in logs!", "red")
+        else:  # this flag was not a requirement, however, it is really easy to do and adds to the usability of the system
+            set_toast("No unread risk detected in logs!", "green")
+
+        def humanize_page(page: int, size: int) -> list[str]:
+            # only the logs of the page that is shown are read and decrypted, starting from the most recent log
+            return [_humanize_log(log) for log in db.get_logs_page(page, size)]
+
+        clear_terminal()
+        choice = lazy_paginated_single_select(_logs_header(), log_count, humanize_page, item_interactable=False,
+                                              persist_toast=True, persisted_options={'F': "Follow new logs",
+                                                                                     'B': "Back"})
+        if choice != -1:
+            return
+        follow_logs()
+
+
+FOLLOW_POLL_INTERVAL = 1  # seconds, checking for new logs is only a file size check when there are none
+
+
+def follow_logs() -> None:
+    """
+    Keeps on showing the new logs the moment they come in (until Ctrl+C is pressed),
+    only the new logs are read and decrypted every time
+    """
+    db = Database(_session)
+    _, cursor = db.follow_logs()
+    if any(db.get_errors()):
+        set_multiple_toasts(db.get_errors(), "red")
+        return
+
+    red, _, _, _, end = _log_colors()
+    clear_terminal()
+    print(_logs_header())
+    print("Following new logs, press Ctrl+C to stop...")
+    try:
+        while True:
+            logs, cursor = db.follow_logs(cursor)
+            for log in logs:
+                if log.suspicious == "True":  # so a new risk stands out between all the other logs
+                    print(f"{red}>>> NEW RISK <<<{end}")
+                print(_humanize_log(log))
+            time.sleep(FOLLOW_POLL_INTERVAL)
+    except KeyboardInterrupt:
+        pass  # back to the overview of the logs
+
+
+def export_logs() -> None:
     clear_terminal()
-    paginated_single_select(header, humanized_logs, item_interactable=False,
-                            persist_toast=True, persisted_options={'B': "Back"})
+    print("Export the logs to a file, leave a filter empty to skip it")
+    export_format = input("Format, csv or jsonl (csv): ").strip().lower() or "csv"
+    start_date = input("From date, yyyy-mm-dd: ").strip() or None
+    end_date = input("Until date, yyyy-mm-dd: ").strip() or None
+    only_suspicious = input("Only the suspicious logs? y/n (n): ").strip().lower() == "y"
+
+    db = Database(_session)
+    result = db.export_logs(export_format, start_date, end_date, True if only_suspicious else None)
+    if any(db.get_errors()):
+        set_multiple_toasts(db.get_errors(), "red")
+    else:
+        set_toast(f"Exported {result['exported']} logs to {result['path']} "
+                  f"({result['logs_per_second']} logs per second)", "green")
+
+
+def export_members() -> None:
+    clear_terminal()
+    print("Export the members to a file")
+    print(f"Fields: {', '.join(IMPORT_FIELDS)}")
+    export_format = input("Format, csv or jsonl (csv): ").strip().lower() or "csv"
+    fields = input("Fields to export, separated by commas (all): ").strip()
+
+    db = Database(_session)
+    result = db.export_members(export_format, [field.strip() for field in fields.split(",")] if fields else None)
+    if any(db.get_errors()):
+        set_multiple_toasts(db.get_errors(), "red")
+    else:
+        set_toast(f"Exported {result['exported']} members to {result['path']} "
+                  f"({result['members_per_second']} members per second)", "green")
 
 
 def create_backup() -> None:
-    db = Database()
+    db = Database(_session)
     db.create_backup()
     if any(db.get_errors()):
         set_multiple_toasts(db.get_errors(), "red")
@@ -422,7 +572,7 @@ def create_backup() -> None:
 
 
 def restore_backup() -> None:
-    db = Database()
+    db = Database(_session)
     backups = db.get_backups()
     if any(db.get_errors()):
         set_multiple_toasts(db.get_errors(), "red")
@@ -451,7 +601,7 @@ def restore_backup() -> None:
 def users_index_page() -> None:
     green = COLOR_CODES['green'] if COLOR_ENABLED else ''
     end = COLOR_CODES['end'] if COLOR_ENABLED else ''
-    db = Database()
+    db = Database(_session)
     users = db.get_all_users()
     if users is None:
         set_multiple_toasts(db.get_errors(), "red")
@@ -461,15 +611,16 @@ def users_index_page() -> None:
     # however, even if a user would get around that and send the backend an add admin request,
     # it would still fail since there it will be authenticated
     persisted_options = {'B': "Back"}
-    if get_current_user().type == UserType.SUPER_ADMIN:
+    if _session.user.type == UserType.SUPER_ADMIN:
         persisted_options["C"] = f"{green}Add new consultant{end}"
         persisted_options["A"] = f"{green}Add new admin{end}"
-    elif get_current_user().type == UserType.ADMIN:
+    elif _session.user.type == UserType.ADMIN:
         persisted_options["C"] = f"{green}Add new consultant{end}"
 
     header = f"    {'Username':<12.12} {'Full Name':<30.30} {'Role':<11.11}"
     header += "\n" + ('-' * len(header))
     while True:
+        preload(users, "username", "first_name", "last_name", "type")
         options = []
         for user in users:
             real_name = f"{user.first_name} {user.last_name}"
@@ -487,14 +638,14 @@ def users_index_page() -> None:
                 # this boolean is nothing more than some optimization. so it won't do a query if noting changed
                 users = db.get_all_users()
         elif (page_result == -2 and
-              get_current_user().type == UserType.ADMIN or get_current_user().type == UserType.SUPER_ADMIN):
+              _session.user.type == UserType.ADMIN or _session.user.type == UserType.SUPER_ADMIN):
 
             success = _register_new_user(UserType.CONSULTANT)
             if success:
                 # this boolean is nothing more than a bit of optimization. so it won't do a query if noting changed
                 users = db.get_all_users()
 
-        elif page_result == -3 and get_current_user().type == UserType.SUPER_ADMIN:
+        elif page_result == -3 and _session.user.type == UserType.SUPER_ADMIN:
             success = _register_new_user(UserType.ADMIN)
             if success:
                 # this boolean is nothing more than a bit of optimization. so it won't do a query if noting changed
@@ -516,7 +667,7 @@ def _user_details(user: User) -> bool:
     print(f"Role: {user.get_role_name()}")
     print(f"Registration date: {user.registration_date}")
 
-    current_user = get_current_user()
+    current_user = _session.user
     # editable if:
     # - Selected user can not be superAdmin
     # - Current user is superAdmin || (Selected user is consultant and Current user is admin)
@@ -558,7 +709,7 @@ def _edit_user(user: User) -> bool:
     username = input(f"Username {currently(user.username)}: ")
     username = username if username else user.username
 
-    db = Database()
+    db = Database(_session)
     if user.type == UserType.CONSULTANT:
         db.update_consultant(user.id, first_name, last_name, username)
     if user.type == UserType.ADMIN:
@@ -580,7 +731,7 @@ def _delete_user(user: User) -> bool:
         print("[N] No")
         chose = input("Chose an option: ")
         if chose.lower() == "y" or chose.lower() == "yes":
-            db = Database()
+            db = Database(_session)
             if user.type == UserType.CONSULTANT:
                 db.delete_consultant(user.id)
             elif user.type == UserType.ADMIN:
@@ -601,8 +752,8 @@ def _reset_users_password(user: User) -> bool:
     clear_terminal()
     set_toast('')
     your_password = password_input('Your password: ')
-    db = Database()
-    current_user = get_current_user()
+    db = Database(_session)
+    current_user = _session.user
 
     if not compare_passwords(your_password, current_user.password_hash):
         set_toast('Incorrect password!', 'red')
@@ -637,7 +788,7 @@ def _register_new_user(role: UserType) -> bool:
     username = input("Username: ")
     password = password_input("Password: ")
 
-    db = Database()
+    db = Database(_session)
     if role == UserType.ADMIN:
         db.create_admin(username, password, first_name, last_name)
     elif role == UserType.CONSULTANT:
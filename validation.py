@@ -130,6 +130,16 @@ def is_valid_gender(input: str) -> bool:
     return input in GENDER_LIST
 
 
+def is_valid_date(input: str) -> bool:
+    if not re.fullmatch(r'\d{4}-\d{2}-\d{2}', input):
+        return False
+    try:
+        datetime.strptime(input, "%Y-%m-%d")
+    except ValueError:
+        return False
+    return True
+
+
 def generate_user_id() -> str:
     """
     This method is used to generate a unique user id for a new member